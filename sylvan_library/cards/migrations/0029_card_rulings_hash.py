@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2018-08-26 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0028_auto_20180225_1550'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='rulings_hash',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2018-08-26 11:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0029_card_rulings_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='cardprinting',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
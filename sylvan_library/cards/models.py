@@ -124,6 +124,12 @@ class Card(models.Model):
 
     links = models.ManyToManyField('self')
 
+    # A hash of the rulings in the json data when they were last imported, so unchanged rulings can be skipped
+    rulings_hash = models.CharField(max_length=40, blank=True, null=True)
+
+    # A hash of the json data the card was last imported from, so unchanged cards can be skipped
+    fingerprint = models.CharField(max_length=40, blank=True, null=True)
+
     @staticmethod
     def get_random_card():
         last = Card.objects.count() - 1
@@ -165,6 +171,9 @@ class CardPrinting(models.Model):
     # These are technically part of the core sets and are tournament legal despite not being available in boosters.
     is_starter = models.BooleanField()
 
+    # A hash of the json data the printing was last imported from, so unchanged printings can be skipped
+    fingerprint = models.CharField(max_length=40, blank=True, null=True)
+
     class Meta:
         unique_together = (
             'set',
@@ -200,10 +209,14 @@ class CardPrintingLanguage(models.Model):
         return f'{self.language} {self.card_printing}'
 
     def get_image_path(self):
-        if self.multiverse_id is None:
+        return CardPrintingLanguage.get_multiverse_image_path(self.multiverse_id)
+
+    @staticmethod
+    def get_multiverse_image_path(multiverse_id):
+        if multiverse_id is None:
             return None
 
-        ms = str(self.multiverse_id)
+        ms = str(multiverse_id)
         # Break up images over multiple folders to stop too many being placed in one folder
         return path.join('static', 'card_images',
                          ms[0:1],
@@ -0,0 +1,130 @@
+import gzip, os, shutil, subprocess, tempfile, time
+
+CHUNK_SIZE = 1024 * 1024
+
+# The compression level used for each format when no level is given
+DEFAULT_COMPRESSION_LEVELS = {'gzip': 6, 'zstd': 3}
+
+
+class BackupResult:
+    def __init__(self, database_name, output_path, size, duration):
+        self.database_name = database_name
+        self.output_path = output_path
+        self.size = size
+        self.duration = duration
+
+    def get_throughput(self):
+        """
+        :return: The number of bytes written per second
+        """
+        return self.size / self.duration if self.duration else 0.0
+
+    def __str__(self):
+        return (f'{self.database_name}: {self.size / 1024 / 1024:.1f}MB in {self.duration:.1f}s '
+                f'({self.get_throughput() / 1024 / 1024:.1f}MB/s) to {self.output_path}')
+
+
+def get_pg_dump_args(database):
+    """
+    Gets the pg_dump arguments that connect to a database
+    :param database: The settings of the database (in the format of settings.DATABASES)
+    """
+    args = ['pg_dump', '--username', database['USER'], '--dbname', database['NAME']]
+    if database.get('HOST'):
+        args += ['--host', database['HOST']]
+    if database.get('PORT'):
+        args += ['--port', str(database['PORT'])]
+
+    return args
+
+
+def get_pg_dump_env(database):
+    env = dict(os.environ)
+    if database.get('PASSWORD'):
+        env['PGPASSWORD'] = database['PASSWORD']
+
+    return env
+
+
+def get_folder_size(folder):
+    return sum(os.path.getsize(os.path.join(dir_path, file_name))
+               for dir_path, _, file_names in os.walk(folder) for file_name in file_names)
+
+
+def backup_to_directory(database, output_path, jobs=1):
+    """
+    Backs up a database with pg_dump in its directory format, which dumps tables on multiple connections at once
+    :param database: The settings of the database
+    :param output_path: The folder to write the backup to (which must not exist yet)
+    :param jobs: The number of tables to dump at the same time
+    :return: A BackupResult
+    """
+    start_time = time.perf_counter()
+
+    # run() reads the output of pg_dump as it is written, so it can't block on a full pipe
+    subprocess.run(get_pg_dump_args(database) + ['--format', 'directory', '--jobs', str(jobs), '--file', output_path],
+                   env=get_pg_dump_env(database), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+    return BackupResult(database['NAME'], output_path, get_folder_size(output_path), time.perf_counter() - start_time)
+
+
+def open_compressor(file, compression, level):
+    """
+    Wraps a file so that everything written to it is compressed
+    :param file: The file to write the compressed data to, which is left open when the compressor is closed
+    :param compression: 'gzip' or 'zstd'
+    :param level: The compression level
+    """
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=file, mode='wb', compresslevel=level)
+
+    if compression == 'zstd':
+        # zstandard is only needed for zstd backups, so it isn't a requirement of the project
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('The zstandard package is required for zstd backups')
+
+        return zstandard.ZstdCompressor(level=level).stream_writer(file)
+
+    raise ValueError(f'Unknown compression {compression}')
+
+
+def backup_to_compressed_file(database, output_path, compression='gzip', level=None):
+    """
+    Streams a plain pg_dump of a database through a compressor in this process.
+    The backup is written to a temporary file that is only renamed to the output path once the dump has succeeded
+    :param database: The settings of the database
+    :param output_path: The path of the compressed file
+    :param compression: 'gzip' or 'zstd'
+    :param level: The compression level, or None to use the default level of the compression
+    :return: A BackupResult
+    """
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVELS[compression]
+
+    start_time = time.perf_counter()
+    temp_path = output_path + '.tmp'
+
+    # stderr goes to a file, as a pipe that isn't read could fill up and block pg_dump
+    with tempfile.TemporaryFile() as error_file:
+        process = subprocess.Popen(get_pg_dump_args(database) + ['--format', 'plain'],
+                                   env=get_pg_dump_env(database), stdout=subprocess.PIPE, stderr=error_file)
+        try:
+            with process.stdout, open(temp_path, 'wb') as file, open_compressor(file, compression, level) as output:
+                shutil.copyfileobj(process.stdout, output, CHUNK_SIZE)
+        except BaseException:
+            process.kill()
+            process.wait()
+            os.remove(temp_path)
+            raise
+
+        return_code = process.wait()
+        if return_code != 0:
+            os.remove(temp_path)
+            error_file.seek(0)
+            raise subprocess.CalledProcessError(return_code, process.args, stderr=error_file.read())
+
+    os.replace(temp_path, output_path)
+
+    return BackupResult(database['NAME'], output_path, os.path.getsize(output_path), time.perf_counter() - start_time)
@@ -0,0 +1,35 @@
+from django.db.models import Case, When, Value
+from django.db.models.functions import Cast
+
+
+def bulk_update(model, objs, field_names, batch_size=None):
+    """
+    Saves the given fields of existing model instances with a single UPDATE query per batch.
+    Django 1.11 doesn't have QuerySet.bulk_update, so this builds the same CASE expression that it uses
+    :param model: The model class of the instances
+    :param objs: The model instances to save
+    :param field_names: The names of the fields to save
+    :param batch_size: The maximum number of instances to update in a single query
+    :return: The number of rows updated
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+
+    fields = [model._meta.get_field(name) for name in field_names]
+    batch_size = batch_size or len(objs)
+    rows_updated = 0
+
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        updates = {}
+
+        for field in fields:
+            when_statements = [When(pk=obj.pk, then=Value(getattr(obj, field.attname), output_field=field))
+                               for obj in batch]
+            # PostgreSQL can't infer the type of a CASE that only has NULL or string literals in it
+            updates[field.name] = Cast(Case(*when_statements, output_field=field), output_field=field)
+
+        rows_updated += model.objects.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+    return rows_updated
@@ -0,0 +1,57 @@
+import io
+
+from django.db import connection
+
+
+class CopyBuffer:
+    """
+    Builds up the rows of a table in memory, so they can all be written with a single COPY FROM STDIN.
+    Primary keys are assigned as rows are added, so this can only be used to fill an empty table
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = model._meta.concrete_fields
+        self.buffer = io.StringIO()
+        self.next_id = 1
+        self.row_count = 0
+
+    def add(self, obj):
+        """
+        Adds a model instance to the table, giving it a primary key if it doesn't already have one
+        :param obj: The unsaved model instance
+        :return: The model instance
+        """
+        if obj.pk is None:
+            obj.pk = self.next_id
+
+        self.next_id = max(self.next_id, obj.pk + 1)
+
+        self.buffer.write(','.join(
+            self.format_value(field.get_db_prep_save(getattr(obj, field.attname), connection))
+            for field in self.fields))
+        self.buffer.write('\n')
+        self.row_count += 1
+        return obj
+
+    @staticmethod
+    def format_value(value):
+        # An unquoted empty value is NULL in the CSV format, so everything else is quoted
+        if value is None:
+            return ''
+
+        return '"' + str(value).replace('"', '""') + '"'
+
+    def copy_to_database(self, cursor):
+        """
+        Writes all the rows to the table, and moves the id sequence of the table past them
+        :param cursor: A cursor of the psycopg2 connection
+        """
+        table_name = self.model._meta.db_table
+        columns = ', '.join(f'"{field.column}"' for field in self.fields)
+
+        self.buffer.seek(0)
+        cursor.copy_expert(f'COPY "{table_name}" ({columns}) FROM STDIN WITH (FORMAT csv)', self.buffer)
+
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence('\"{table_name}\"', 'id'), "
+                       f"coalesce(max(id), 1), max(id) IS NOT NULL) FROM \"{table_name}\";")
@@ -0,0 +1,108 @@
+import json, logging, os
+
+import requests
+
+from data_import._hashing import get_file_hash
+
+logger = logging.getLogger('django')
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def load_metadata(metadata_path):
+    if not os.path.isfile(metadata_path):
+        return {}
+
+    with open(metadata_path, 'r', encoding='utf8') as f:
+        return json.load(f)
+
+
+def save_metadata(metadata_path, metadata):
+    with open(metadata_path, 'w', encoding='utf8') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def download_file(url, file_path, metadata_path, session=None, force=False):
+    """
+    Downloads a file in chunks, only if it has changed since it was last downloaded.
+    The ETag and Last-Modified headers of the last download are stored in a metadata file and sent back to the server,
+    and a download that was interrupted is resumed from where it stopped with a Range request
+    :param url: The url to download the file from
+    :param file_path: The path to write the file to
+    :param metadata_path: The path of the json file that the headers and hash of the download are kept in
+    :param session: The requests session to download the file with
+    :param force: True if the file should be downloaded even if it hasn't changed
+    :return: True if the content of the file changed, otherwise False
+    """
+    session = session or requests.Session()
+    part_path = file_path + '.part'
+
+    metadata = load_metadata(metadata_path)
+    if force or metadata.get('url') != url:
+        metadata = {'url': url}
+
+    headers = {}
+    resume_from = 0
+
+    partial_validator = metadata.get('partial_etag') or metadata.get('partial_last_modified')
+    if os.path.isfile(part_path) and partial_validator:
+        resume_from = os.path.getsize(part_path)
+        headers['Range'] = f'bytes={resume_from}-'
+        # The server sends the whole file instead if it has changed since the partial download started
+        headers['If-Range'] = partial_validator
+    elif os.path.isfile(file_path):
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+    response = session.get(url, headers=headers, stream=True)
+    try:
+        if response.status_code == 304:
+            logger.info(f'{url} has not been modified')
+            return False
+
+        if response.status_code == 416:
+            # The partial file is no longer valid for the file on the server, so it has to be downloaded again
+            logger.info(f'Could not resume the download of {url}, restarting it')
+            os.remove(part_path)
+            metadata.pop('partial_etag', None)
+            metadata.pop('partial_last_modified', None)
+            save_metadata(metadata_path, metadata)
+            return download_file(url, file_path, metadata_path, session=session, force=force)
+
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            logger.info(f'Resuming download of {url} from {resume_from} bytes')
+            mode = 'ab'
+        else:
+            logger.info(f'Downloading {url}')
+            mode = 'wb'
+
+        # Record the validators before writing anything so the download can be resumed if it is interrupted
+        metadata['partial_etag'] = response.headers.get('ETag')
+        metadata['partial_last_modified'] = response.headers.get('Last-Modified')
+        save_metadata(metadata_path, metadata)
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+    finally:
+        response.close()
+
+    content_hash = get_file_hash(part_path)
+    os.replace(part_path, file_path)
+
+    changed = content_hash != metadata.get('content_hash')
+    metadata.update({
+        'etag': metadata.pop('partial_etag'),
+        'last_modified': metadata.pop('partial_last_modified'),
+        'content_hash': content_hash,
+    })
+    save_metadata(metadata_path, metadata)
+
+    if not changed:
+        logger.info(f'The content of {url} has not changed')
+
+    return changed
@@ -0,0 +1,17 @@
+import hashlib
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_hash(file_path):
+    """
+    Gets the SHA1 hash of a file, reading it a chunk at a time
+    :param file_path: The path of the file
+    :return: The hex digest of the hash
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
@@ -0,0 +1,168 @@
+import collections, logging, os, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('django')
+
+CHUNK_SIZE = 64 * 1024
+
+# Responses that are worth retrying, as the server may be able to handle the request later
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    A thread safe rate limiter that allows a burst of up to `capacity` calls,
+    and then `rate` calls per second after that
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.last_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a token from the bucket, waiting until one is available if the bucket is empty
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+                self.last_time = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait_time = (1 - self.tokens) / self.rate
+
+            time.sleep(wait_time)
+
+
+class ImageDownloader:
+    """
+    Downloads files on a pool of threads that share a single keep-alive session
+    """
+
+    def __init__(self, concurrency=8, rate_limit=None, max_retries=3, backoff=1.0, timeout=30, session=None):
+        """
+        :param concurrency: The maximum number of downloads to run at the same time
+        :param rate_limit: The maximum number of requests per second to send to each host, or None for no limit
+        :param max_retries: The number of times to retry a download that failed with a connection or server error
+        :param backoff: The number of seconds to wait before the first retry, which doubles for each retry after that
+        :param timeout: The number of seconds to wait for the server to respond
+        :param session: The requests session to download with
+        """
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+        self.rate_limiters = {}
+        self.rate_limiters_lock = threading.Lock()
+
+    def get_rate_limiter(self, url):
+        host = urlparse(url).netloc
+        with self.rate_limiters_lock:
+            if host not in self.rate_limiters:
+                self.rate_limiters[host] = TokenBucket(self.rate_limit)
+            return self.rate_limiters[host]
+
+    def download(self, url, file_path):
+        """
+        Downloads a file, retrying connection and server errors.
+        The file is written to a temporary file first, so a failed download never leaves a partial file behind
+        :param url: The url of the file
+        :param file_path: The path to write the file to
+        :return: True if the file was downloaded, otherwise False
+        """
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            if self.rate_limit:
+                self.get_rate_limiter(url).acquire()
+
+            try:
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    if response.status_code in RETRY_STATUS_CODES:
+                        logger.info(f'{url} returned {response.status_code} (attempt {attempt + 1})')
+                        continue
+
+                    response.raise_for_status()
+                    self.write_response(response, file_path)
+                    return True
+
+            except requests.HTTPError as ex:
+                logger.error(f'Could not download {url}: {ex}')
+                return False
+            except requests.RequestException as ex:
+                # This includes the connection dropping part way through the image (ChunkedEncodingError)
+                logger.info(f'Could not download {url}: {ex} (attempt {attempt + 1})')
+
+        logger.error(f'Giving up on {url} after {self.max_retries + 1} attempts')
+        return False
+
+    def write_response(self, response, file_path):
+        temp_file = tempfile.NamedTemporaryFile(dir=os.path.dirname(file_path), suffix='.tmp', delete=False)
+        try:
+            with temp_file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    temp_file.write(chunk)
+
+            os.replace(temp_file.name, file_path)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+
+    def download_all(self, downloads):
+        """
+        Downloads files on the thread pool.
+        Only a few downloads per thread are queued at a time, so the downloads can be read lazily
+        :param downloads: An iterable of (url, file_path) tuples
+        :return: A (downloaded_count, failed_count) tuple
+        """
+        downloaded_count = 0
+        failed_count = 0
+        pending = collections.deque()
+
+        def wait_for_next():
+            nonlocal downloaded_count, failed_count
+            url, future = pending.popleft()
+            try:
+                downloaded = future.result()
+            except Exception:
+                # One image failing in an unexpected way shouldn't stop the rest from being downloaded
+                logger.exception(f'Could not download {url}')
+                downloaded = False
+
+            if downloaded:
+                downloaded_count += 1
+            else:
+                failed_count += 1
+
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for url, file_path in downloads:
+                if len(pending) >= self.concurrency * 2:
+                    wait_for_next()
+
+                pending.append((url, executor.submit(self.download, url, file_path)))
+
+            while pending:
+                wait_for_next()
+
+        return downloaded_count, failed_count
@@ -0,0 +1,68 @@
+import time
+
+from data_import._profiling import ImportProfiler
+from data_import._reference_cache import ReferenceCache
+
+
+class ImportContext:
+    """
+    The state of a single update_database run
+    """
+
+    def __init__(self, force_update=False, batch_size=500, force_update_sets=None, profile_dir=None):
+        # Update sets that already exist, and cards that have already been added
+        self.force_update = force_update
+
+        # The maximum number of rows to write in a single bulk query
+        self.batch_size = batch_size
+
+        # Keep track of which sets are new, so that printing information for existing sets doesn't have to be parsed
+        self.sets_to_update = set(force_update_sets or [])
+
+        # Keep track of which cards have been updated, so that reprints don't trigger pointless updates
+        self.updated_cards = set()
+
+        # Keep track of which cards have had their legalities updated, as legalities are the same across all printings
+        self.legality_updated_cards = set()
+
+        # Keep track of which cards have had their rulings updated, as rulings are the same across all printings
+        self.ruling_updated_cards = set()
+
+        # When sets are imported out of order (by update_database --workers), these hold the code of the set
+        # that each card is updated from, and the set that its rulings and legalities are updated from,
+        # so that the result is the same as when the sets are imported in release date order
+        self.card_update_sets = None
+        self.card_first_sets = None
+
+        self.reference_cache = ReferenceCache()
+
+        self.profiler = ImportProfiler(profile_dir)
+
+        self.start_time = time.time()
+
+        self.update_counts = {'rarities_created': 0, 'rarities_updated': 0,
+                              'colours_created': 0, 'colours_updated': 0,
+                              'languages_created': 0, 'languages_updated': 0,
+                              'cards_created': 0, 'cards_updated': 0, 'cards_ignored': 0, 'cards_unchanged': 0,
+                              'card_printings_created': 0, 'card_printings_updated': 0,
+                              'card_printings_unchanged': 0,
+                              'printing_languages_created': 0, 'printing_languages_skipped': 0,
+                              'physical_cards_created': 0, 'physical_cards_skipped': 0,
+                              'card_links_created': 0,
+                              'blocks_created': 0,
+                              'sets_created': 0, 'sets_updated': 0,
+                              'rulings_created': 0, 'rulings_deleted': 0, 'ruling_cards_unchanged': 0,
+                              'legalities_created': 0, 'legalities_deleted': 0,
+                              'legalities_unchanged': 0}
+
+    def should_update_card(self, card_name, set_code):
+        """
+        Checks whether a card that already exists should be updated from its printing in the given set
+        """
+        return self.card_update_sets is None or self.card_update_sets.get(card_name) == set_code
+
+    def is_first_printing(self, card_name, set_code):
+        """
+        Checks whether the printing of a card in the given set is the first one in the update
+        """
+        return self.card_first_sets is None or self.card_first_sets.get(card_name) == set_code
@@ -0,0 +1,114 @@
+import codecs
+import json
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+class JsonStreamReader:
+    """
+    Incrementally reads the members of a top level JSON object from a binary file,
+    so that only a single member has to be held in memory at a time
+    """
+
+    def __init__(self, file, chunk_size=1024 * 1024):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.utf8_decoder = codecs.getincrementaldecoder('utf8')()
+
+        self.text = ''
+        self.pos = 0
+        # The byte offset in the file of the first character in self.text
+        self.byte_offset = file.tell()
+        self.eof = False
+
+    def iter_items(self):
+        """
+        Yields a (key, value, byte_offset, byte_length) tuple for each member of the object,
+        where the offset and length give the location of the value in the file
+        """
+        self.expect('{')
+
+        if self.peek() == '}':
+            return
+
+        while True:
+            key = self.decode_value()
+            self.expect(':')
+
+            self.skip_whitespace()
+            self.compact()
+            value_offset = self.byte_offset
+            value, end = self.raw_decode()
+            value_length = len(self.text[self.pos:end].encode('utf8'))
+            self.pos = end
+
+            yield key, value, value_offset, value_length
+
+            if self.peek() == '}':
+                return
+
+            self.expect(',')
+
+    def fill(self):
+        """
+        Reads more data into the buffer, returning False if the end of the file has been reached
+        """
+        if self.eof:
+            return False
+
+        self.compact()
+        # Read at least as much as is already buffered so large values aren't re-parsed too often
+        data = self.file.read(max(self.chunk_size, len(self.text)))
+        self.eof = not data
+        self.text += self.utf8_decoder.decode(data, final=self.eof)
+        return True
+
+    def compact(self):
+        """
+        Discards the part of the buffer that has already been read
+        """
+        if self.pos == 0:
+            return
+
+        self.byte_offset += len(self.text[:self.pos].encode('utf8'))
+        self.text = self.text[self.pos:]
+        self.pos = 0
+
+    def skip_whitespace(self):
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _whitespace:
+                self.pos += 1
+
+            if self.pos < len(self.text) or not self.fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        return self.text[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f'Expecting {char!r}', self.text, self.pos)
+
+        self.pos += 1
+
+    def raw_decode(self):
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+
+            # A number at the end of the buffer may have been cut short
+            if end == len(self.text) and self.fill():
+                continue
+
+            return value, end
+
+    def decode_value(self):
+        self.skip_whitespace()
+        value, self.pos = self.raw_decode()
+        return value
@@ -0,0 +1,48 @@
+import hashlib
+
+
+def get_lock_id(key):
+    """
+    Converts a lock name to the 64 bit integer used by the PostgreSQL advisory lock functions
+    :param key: The name of the lock (e.g. 'card:Forest')
+    :return: A signed 64 bit integer
+    """
+    return int.from_bytes(hashlib.sha1(key.encode('utf8')).digest()[:8], 'big', signed=True)
+
+
+def get_set_lock_keys(staged_set):
+    """
+    Gets the names of the locks that have to be held while a set is imported,
+    which cover every row that could also be written by the import of another set
+    :param staged_set: The set that will be imported
+    :return: A set of lock names
+    """
+    keys = set()
+
+    if staged_set.has_block():
+        keys.add('block:' + staged_set.get_block())
+
+    for staged_card in staged_set.get_cards():
+        keys.add('card:' + staged_card.get_name())
+
+        if staged_card.has_other_names():
+            keys.update('card:' + name for name in staged_card.get_other_names())
+
+        keys.update('format:' + legality['format'] for legality in staged_card.get_legalities())
+
+    return keys
+
+
+def acquire_locks(cursor, keys):
+    """
+    Takes a transaction level advisory lock for each of the keys, waiting for any that are held by other connections.
+    The locks are always taken in the same order, so two connections can't deadlock waiting on each other
+    :param cursor: A cursor inside the transaction to take the locks in
+    :param keys: The names of the locks
+    """
+    lock_ids = sorted({get_lock_id(key) for key in keys})
+    if not lock_ids:
+        return
+
+    # unnest() keeps the order of the array, so the locks are taken in sorted order
+    cursor.execute('SELECT pg_advisory_xact_lock(lock_id) FROM unnest(%s::bigint[]) AS lock_id', [lock_ids])
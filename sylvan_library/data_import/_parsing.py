@@ -0,0 +1,19 @@
+import re
+
+COLLECTOR_NUMBER_PATTERN = re.compile(r'^(?P<special>[\D]+)?(?P<number>[\d]+)(?P<letter>[\D]+)?$')
+MCI_NUMBER_PATTERN = re.compile(r'^(/(?P<set>[^/]*)/(?P<lang>[^/]*)/)?(?P<num>[0-9]+)(\.html)?$')
+NUMERIC_STAT_PATTERN = re.compile(r'(-?[\d.]+)')
+GENERIC_MANA_PATTERN = re.compile(r'\d+')
+
+# The number of colours in each combination of the five colour flags
+COLOUR_TO_COUNT = {colour: bin(colour).count('1') for colour in range(32)}
+
+
+def parse_generic_mana(mana_cost):
+    """
+    Finds the generic mana in a mana cost (e.g. 2 for '{2}{W}{U}')
+    :param mana_cost: The mana cost to parse
+    :return: The first number in the mana cost (so '{2/R}' counts as 2), or 0 if it doesn't have one
+    """
+    match = GENERIC_MANA_PATTERN.search(mana_cost)
+    return int(match.group()) if match else 0
@@ -0,0 +1,153 @@
+import cProfile, json, os, time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.db.backends.utils import CursorWrapper
+
+
+class TimedCursorWrapper(CursorWrapper):
+    """
+    A cursor that reports the time taken by each query to an ImportProfiler
+    """
+
+    def __init__(self, cursor, db, profiler):
+        super().__init__(cursor, db)
+        self.profiler = profiler
+
+    def execute(self, sql, params=None):
+        start_time = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self.profiler.record_query(time.perf_counter() - start_time)
+
+    def executemany(self, sql, param_list):
+        start_time = time.perf_counter()
+        try:
+            return super().executemany(sql, param_list)
+        finally:
+            self.profiler.record_query(time.perf_counter() - start_time)
+
+    def copy_expert(self, sql, file):
+        start_time = time.perf_counter()
+        try:
+            with self.db.wrap_database_errors:
+                return self.cursor.copy_expert(sql, file)
+        finally:
+            self.profiler.record_query(time.perf_counter() - start_time)
+
+
+class PhaseStats:
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def add(self, other):
+        self.calls += other.calls
+        self.wall_time += other.wall_time
+        self.cpu_time += other.cpu_time
+        self.query_count += other.query_count
+        self.query_time += other.query_time
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'wall_time': round(self.wall_time, 3),
+            'cpu_time': round(self.cpu_time, 3),
+            'query_count': self.query_count,
+            'query_time': round(self.query_time, 3),
+        }
+
+
+class ImportProfiler:
+    """
+    Records the wall time, CPU time and SQL queries of each phase of an import.
+    A phase can be run multiple times (e.g. once per set), and the totals are recorded
+    """
+
+    def __init__(self, profile_dir=None):
+        # The folder to write a cProfile file for each phase to, or None to not run cProfile
+        self.profile_dir = profile_dir
+
+        self.phases = OrderedDict()
+        self.profiles = {}
+        self.query_count = 0
+        self.query_time = 0.0
+
+    @contextmanager
+    def install(self, connection):
+        """
+        Times every query run on the connection until the context is exited.
+        Django 1.11 doesn't have connection.execute_wrapper, so the debug cursor is replaced instead
+        """
+        connection.make_debug_cursor = lambda cursor: TimedCursorWrapper(cursor, connection, self)
+        force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        try:
+            yield
+        finally:
+            connection.force_debug_cursor = force_debug_cursor
+            del connection.make_debug_cursor
+
+    def record_query(self, duration):
+        self.query_count += 1
+        self.query_time += duration
+
+    @contextmanager
+    def phase(self, name):
+        stats = self.phases.setdefault(name, PhaseStats())
+
+        profile = None
+        if self.profile_dir:
+            profile = self.profiles.setdefault(name, cProfile.Profile())
+
+        query_count = self.query_count
+        query_time = self.query_time
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+
+            stats.calls += 1
+            stats.wall_time += time.perf_counter() - wall_start
+            stats.cpu_time += time.process_time() - cpu_start
+            stats.query_count += self.query_count - query_count
+            stats.query_time += self.query_time - query_time
+
+    def merge_phases(self, phases):
+        """
+        Adds the phase totals recorded by another profiler (e.g. one in a worker process) to this one
+        :param phases: The phases attribute of the other profiler
+        """
+        for name, stats in phases.items():
+            self.phases.setdefault(name, PhaseStats()).add(stats)
+
+    def get_report(self):
+        return OrderedDict((name, stats.as_dict()) for name, stats in self.phases.items())
+
+    def log_report(self, logger):
+        logger.info(f'{"Phase":<28}{"Wall (s)":>10}{"CPU (s)":>10}{"Queries":>10}{"SQL (s)":>10}')
+        for name, stats in self.phases.items():
+            logger.info(f'{name:<28}{stats.wall_time:>10.2f}{stats.cpu_time:>10.2f}'
+                        f'{stats.query_count:>10}{stats.query_time:>10.2f}')
+
+    def write_report(self, report_path):
+        with open(report_path, 'w', encoding='utf8') as f:
+            json.dump(self.get_report(), f, indent=2)
+
+    def write_profiles(self):
+        if not self.profile_dir:
+            return
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for name, profile in self.profiles.items():
+            profile.dump_stats(os.path.join(self.profile_dir, name + '.prof'))
@@ -0,0 +1,55 @@
+from cards.models import Format, Language, Rarity, Set
+
+
+class ModelCache:
+    """
+    An in-memory copy of a small reference table, keyed by one of its unique fields
+    """
+
+    def __init__(self, model, key_field):
+        self.model = model
+        self.key_field = key_field
+        self.objs = {}
+
+    def load(self):
+        self.objs = {getattr(obj, self.key_field): obj for obj in self.model.objects.all()}
+
+    def add(self, obj):
+        self.objs[getattr(obj, self.key_field)] = obj
+
+    def find(self, key):
+        return self.objs.get(key)
+
+    def get(self, key):
+        try:
+            return self.objs[key]
+        except KeyError:
+            raise self.model.DoesNotExist(
+                f'{self.model.__name__} matching {self.key_field}={key!r} does not exist')
+
+    def get_or_create(self, key):
+        obj = self.objs.get(key)
+        if obj is not None:
+            return obj, False
+
+        obj = self.model(**{self.key_field: key})
+        obj.save()
+        self.add(obj)
+        return obj, True
+
+
+class ReferenceCache:
+    """
+    Caches the reference tables that are looked up for every card during an import.
+    Any objects created while the cache is in use should be added to it
+    """
+
+    def __init__(self):
+        self.rarities = ModelCache(Rarity, 'name')
+        self.languages = ModelCache(Language, 'name')
+        self.sets = ModelCache(Set, 'code')
+        self.formats = ModelCache(Format, 'name')
+
+    def load(self):
+        for cache in (self.rarities, self.languages, self.sets, self.formats):
+            cache.load()
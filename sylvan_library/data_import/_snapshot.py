@@ -0,0 +1,67 @@
+import os, pickle
+
+from data_import.staging import FINGERPRINT_VERSION
+
+# Increase this whenever StagedSet or StagedCard change, so that snapshots with the old layout aren't loaded
+SNAPSHOT_VERSION = 1
+
+
+def get_snapshot_header(source_hash):
+    return {'version': SNAPSHOT_VERSION, 'fingerprint_version': FINGERPRINT_VERSION, 'source_hash': source_hash}
+
+
+def is_snapshot_valid(snapshot_path, source_hash):
+    """
+    Checks whether a snapshot was written by this version of the staging code from the same json file
+    :param snapshot_path: The path of the snapshot
+    :param source_hash: The SHA1 hash of the json file
+    :return: True if the snapshot can be loaded, otherwise False
+    """
+    if not os.path.isfile(snapshot_path):
+        return False
+
+    with open(snapshot_path, 'rb') as f:
+        try:
+            return pickle.load(f) == get_snapshot_header(source_hash)
+        except (pickle.UnpicklingError, EOFError):
+            return False
+
+
+def iter_snapshot(snapshot_path):
+    """
+    Yields the staged sets from a snapshot one at a time, in the order they were written
+    :param snapshot_path: The path of the snapshot
+    """
+    with open(snapshot_path, 'rb') as f:
+        # Skip the header
+        pickle.load(f)
+
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class SnapshotWriter:
+    """
+    Writes staged sets to a snapshot as they are staged.
+    The snapshot is written to a temporary file that only replaces the old snapshot once every set has been added
+    """
+
+    def __init__(self, snapshot_path, source_hash):
+        self.snapshot_path = snapshot_path
+        self.temp_path = snapshot_path + '.tmp'
+        self.file = open(self.temp_path, 'wb')
+        pickle.dump(get_snapshot_header(source_hash), self.file, pickle.HIGHEST_PROTOCOL)
+
+    def add(self, staged_set):
+        pickle.dump(staged_set, self.file, pickle.HIGHEST_PROTOCOL)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.temp_path, self.snapshot_path)
+
+    def discard(self):
+        self.file.close()
+        os.remove(self.temp_path)
@@ -0,0 +1,59 @@
+from cards.models import CardPrintingLanguage
+
+# The through model that links printing languages to physical cards
+PhysicalCardLink = CardPrintingLanguage.physical_cards.through
+
+
+def get_physical_card_map(card_names=None):
+    """
+    Finds the physical cards of the English printing of every card in every set
+    :param card_names: The names of the cards to find, or None to find every card
+    :return: A dict of lists of physical card ids keyed by (card name, set code)
+    """
+    links = PhysicalCardLink.objects.filter(cardprintinglanguage__language__name='English')
+    if card_names is not None:
+        links = links.filter(cardprintinglanguage__card_printing__card__name__in=card_names)
+
+    rows = links.order_by('cardprintinglanguage__card_printing_id', 'physicalcard_id').values_list(
+        'cardprintinglanguage__card_printing__card__name',
+        'cardprintinglanguage__card_printing__set__code',
+        'cardprintinglanguage__card_printing_id',
+        'physicalcard_id')
+
+    physical_card_map = {}
+    printing_ids = {}
+    for card_name, set_code, printing_id, physical_card_id in rows.iterator():
+        key = (card_name, set_code)
+
+        # A card can be printed more than once in a set, in which case only the first printing is used
+        if printing_ids.setdefault(key, printing_id) != printing_id:
+            continue
+
+        physical_card_map.setdefault(key, []).append(physical_card_id)
+
+    return physical_card_map
+
+
+class ImportErrorReport:
+    """
+    Collects the lines of a user card file that couldn't be imported, so they can all be reported at the end
+    """
+
+    def __init__(self):
+        self.errors = []
+
+    def add(self, line_number, line, message):
+        self.errors.append((line_number, line.rstrip('\n'), message))
+
+    def log(self, logger):
+        if not self.errors:
+            return
+
+        logger.error(f'{len(self.errors)} lines could not be imported:')
+        for line_number, line, message in self.errors:
+            logger.error(f'Line {line_number}: {message} ({line!r})')
+
+    def write(self, report_path):
+        with open(report_path, 'w', encoding='utf8') as f:
+            for line_number, line, message in self.errors:
+                f.write(f'{line_number}\t{message}\t{line}\n')
@@ -0,0 +1,31 @@
+import django
+
+# The update_database command that imports sets in this worker process
+worker_command = None
+
+
+def init_set_worker(options, card_update_sets, card_first_sets):
+    """
+    Sets up a worker process for update_database --workers.
+    Worker processes are spawned rather than forked on some platforms (e.g. Windows), in which case
+    this module is imported before Django is set up, so the models are only imported once it has been
+    :param options: The options of update_database that the workers use
+    :param card_update_sets: The code of the set that each card is updated from, keyed by card name
+    :param card_first_sets: The code of the first set in the update that each card is in, keyed by card name
+    """
+    global worker_command
+    django.setup()
+
+    from data_import.management.commands.update_database import Command
+
+    worker_command = Command()
+    worker_command.init_worker(options, card_update_sets, card_first_sets)
+
+
+def import_set_in_worker(set_entry):
+    """
+    Stages and imports a single set in a worker process
+    :param set_entry: The (offset, length) of the set in the json file
+    :return: The update counts and profiler phases of the set
+    """
+    return worker_command.import_set_entry(set_entry)
@@ -1,36 +1,144 @@
-import json
+import collections, itertools, json, multiprocessing
+
+import django
 
 from data_import.staging import *
 from data_import import _paths
+from data_import._hashing import get_file_hash
+from data_import._json_stream import JsonStreamReader
+from data_import._snapshot import SnapshotWriter, is_snapshot_valid, iter_snapshot
+
+
+def stage_set(file, offset, length):
+    """
+    Reads a single set from the json file and stages it
+    :param file: The json file opened in binary mode
+    :param offset: The byte offset of the set in the file
+    :param length: The length of the set in bytes
+    :return: The StagedSet with its cards already sorted
+    """
+    file.seek(offset)
+    staged_set = StagedSet(json.loads(file.read(length).decode('utf8')))
+    staged_set.get_cards()
+    return staged_set
+
+
+def stage_set_from_path(json_path, offset, length):
+    with open(json_path, 'rb') as f:
+        return stage_set(f, offset, length)
 
 
 class JsonImporter:
-    def __init__(self):
-        self.sets = list()
-        pass
+    def __init__(self, staging_workers=1, use_snapshot=True):
+        # The number of processes to stage sets in (sets are staged in this process if this is 1)
+        self.staging_workers = staging_workers
 
-    def parse_json(self):
-        f = open(_paths.json_data_path, 'r', encoding="utf8")
-        json_data = json.load(f, encoding='UTF-8')
-        f.close()
-        return json_data
+        # Load the staged sets from the snapshot of the last run if the json file hasn't changed since
+        self.use_snapshot = use_snapshot
+
+        self.source_hash = None
+
+    def iter_staged_sets(self):
+        """
+        Yields a StagedSet for every set in the json file in release date order.
+        The sets are loaded from the snapshot if it was written from the same json file,
+        otherwise they are staged from the json file and a new snapshot is written as they are yielded
+        """
+        if not self.use_snapshot:
+            yield from self.stage_sets()
+            return
+
+        source_hash = self.get_source_hash()
+        if is_snapshot_valid(_paths.snapshot_path, source_hash):
+            yield from iter_snapshot(_paths.snapshot_path)
+            return
+
+        snapshot_writer = SnapshotWriter(_paths.snapshot_path, source_hash)
+        try:
+            for staged_set in self.stage_sets():
+                # The set is written before it is yielded, as the update changes the staged cards
+                snapshot_writer.add(staged_set)
+                yield staged_set
+        except BaseException:
+            snapshot_writer.discard()
+            raise
+
+        snapshot_writer.commit()
+
+    def stage_sets(self):
+        """
+        Stages every set in the json file in release date order.
+        Only the sets currently being staged are held in memory, the rest are read
+        from the file when they are needed
+        """
+        set_index = self.index_sets()
+
+        if self.staging_workers > 1:
+            yield from self.iter_staged_sets_in_pool(set_index)
+            return
+
+        with open(_paths.json_data_path, 'rb') as f:
+            for offset, length in set_index:
+                yield stage_set(f, offset, length)
+
+    def iter_staged_sets_in_pool(self, set_index):
+        """
+        Stages the sets in a pool of worker processes, yielding them in the same order as the index.
+        Only a few sets per worker are staged ahead of the one being yielded, so memory use stays bounded
+        """
+        pending_sets = collections.deque()
+        set_entries = iter(set_index)
+
+        with multiprocessing.Pool(self.staging_workers, initializer=django.setup) as pool:
+            for offset, length in itertools.islice(set_entries, self.staging_workers * 2):
+                pending_sets.append(pool.apply_async(stage_set_from_path, (_paths.json_data_path, offset, length)))
+
+            while pending_sets:
+                staged_set = pending_sets.popleft().get()
+
+                next_entry = next(set_entries, None)
+                if next_entry is not None:
+                    pending_sets.append(pool.apply_async(stage_set_from_path, (_paths.json_data_path, *next_entry)))
+
+                yield staged_set
+
+    def get_source_hash(self):
+        """
+        Gets the SHA1 hash of the json file
+        """
+        if self.source_hash is None:
+            self.source_hash = get_file_hash(_paths.json_data_path)
 
-    def import_data(self):
-        json_data = self.parse_json()
+        return self.source_hash
 
-        raw_sets = sorted(
-            json_data.items(),
-            key=lambda card_set: card_set[1]["releaseDate"])
+    def index_sets(self):
+        """
+        Finds where each set is in the json file.
+        Each set is decoded here to read its release date, and decoded again when it is staged.
+        The second pass only holds one set in memory at a time, and decoding is a small part of the time of an update
+        :return: A list of (offset, length) tuples for each set in release date order
+        """
+        with open(_paths.json_data_path, 'rb') as f:
+            set_index = [(json_set['releaseDate'], offset, length)
+                         for _, json_set, offset, length in JsonStreamReader(f).iter_items()]
 
-        for raw_set in raw_sets:
-            self.add_set(raw_set[1])
+        set_index.sort(key=lambda entry: entry[0])
+        return [entry[1:] for entry in set_index]
 
-    def add_set(self, json_set):
-        s = StagedSet(json_set)
-        self.sets.append(s)
+    def index_set_cards(self):
+        """
+        Finds where each set is in the json file, and the names of the cards in it.
+        This holds the name of every card in memory, so it is only used by update_database --workers,
+        which has to know which sets each card is in before the sets are imported
+        :return: A list of (offset, length, set code, card names) tuples for each set in release date order
+        """
+        with open(_paths.json_data_path, 'rb') as f:
+            set_index = [(json_set['releaseDate'], offset, length, json_set['code'],
+                          {get_card_name(json_card) for json_card in json_set['cards']})
+                         for _, json_set, offset, length in JsonStreamReader(f).iter_items()]
 
-    def get_staged_sets(self):
-        return self.sets
+        set_index.sort(key=lambda entry: entry[0])
+        return [entry[1:] for entry in set_index]
 
     def import_colours(self):
         file = open(_paths.colour_json_path, 'r', encoding='utf8')
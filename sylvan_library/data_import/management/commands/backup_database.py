@@ -1,21 +1,102 @@
-from django.core.management.base import BaseCommand
-from sylvan_library.database_connections import DATABASES as database_list
-import os
-import subprocess
 import datetime
+import logging
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from data_import._backup import backup_to_compressed_file, backup_to_directory
+
+logger = logging.getLogger('django')
+
+# The file extension of each backup format
+BACKUP_EXTENSIONS = {'directory': '', 'gzip': '.sql.gz', 'zstd': '.sql.zst'}
 
 
 class Command(BaseCommand):
     help = 'Backs up the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            dest='databases',
+            nargs='*',
+            help='The aliases of the databases to back up (all databases are backed up by default)',
+        )
+
+        parser.add_argument(
+            '--format',
+            dest='format',
+            choices=sorted(BACKUP_EXTENSIONS.keys()),
+            default='gzip',
+            help='Either a pg_dump directory backup, or a plain dump compressed with gzip or zstd',
+        )
+
+        parser.add_argument(
+            '--jobs',
+            dest='jobs',
+            type=int,
+            default=1,
+            help='The number of tables pg_dump dumps at the same time (directory format only)',
+        )
+
+        parser.add_argument(
+            '--level',
+            dest='level',
+            type=int,
+            help='The compression level (gzip and zstd formats only)',
+        )
+
+        parser.add_argument(
+            '--parallel',
+            dest='parallel',
+            type=int,
+            default=2,
+            help='The number of databases to back up at the same time',
+        )
+
+        parser.add_argument(
+            '--output-dir',
+            dest='output_dir',
+            default=os.path.join('data_import', 'backup'),
+            help='The folder to write the backups to',
+        )
+
     def handle(self, *args, **options):
-        for key, database in database_list.items():
-            os.environ['PGPASSWORD'] = database['PASSWORD']
-            now = datetime.datetime.now()
-            filename = database['NAME'] + '_' + re.sub('\D', '_', now.isoformat())
-            output_file = os.path.join('data_import', 'backup', filename)
-            cmd = 'pg_dump -U ' + database['USER'] + ' -d ' + \
-                  database['NAME'] + '| 7z a ' + output_file + '.7z -si' + filename + '.sql'
-            ps = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            ps.wait()
+        aliases = options['databases'] or list(settings.DATABASES.keys())
+        for alias in aliases:
+            if alias not in settings.DATABASES:
+                raise CommandError(f'Unknown database {alias}')
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        with ThreadPoolExecutor(options['parallel']) as executor:
+            futures = {alias: executor.submit(self.backup_database, settings.DATABASES[alias], options)
+                       for alias in aliases}
+
+        failed = False
+        for alias, future in futures.items():
+            try:
+                logger.info(f'Backed up {future.result()}')
+            except Exception as ex:
+                logger.error(f'Could not back up {alias}: {ex}')
+                if getattr(ex, 'stderr', None):
+                    logger.error(ex.stderr.decode('utf8', 'replace'))
+                failed = True
+
+        if failed:
+            raise CommandError('Not all databases were backed up')
+
+    def backup_database(self, database, options):
+        now = datetime.datetime.now()
+        filename = database['NAME'] + '_' + re.sub(r'\D', '_', now.isoformat())
+        output_path = os.path.join(options['output_dir'], filename + BACKUP_EXTENSIONS[options['format']])
+
+        logger.info(f'Backing up {database["NAME"]} to {output_path}')
+
+        if options['format'] == 'directory':
+            return backup_to_directory(database, output_path, options['jobs'])
+
+        return backup_to_compressed_file(database, output_path, options['format'], options['level'])
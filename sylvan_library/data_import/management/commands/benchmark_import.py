@@ -0,0 +1,220 @@
+import json, logging, re, time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from data_import import _paths
+from data_import.importers import JsonImporter
+from data_import.management.commands.update_database import Command as UpdateDatabaseCommand, SET_PHASES
+from data_import._import_context import ImportContext
+from data_import._parsing import COLLECTOR_NUMBER_PATTERN, MCI_NUMBER_PATTERN, NUMERIC_STAT_PATTERN, COLOUR_TO_COUNT, \
+    parse_generic_mana
+from data_import.staging import StagedSet
+
+
+class Command(BaseCommand):
+    help = 'Times parts of update_database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'benchmark',
+            choices=['bookkeeping', 'staging', 'parsing'],
+            help='The part of the import to benchmark',
+        )
+
+        parser.add_argument(
+            '--sizes',
+            dest='sizes',
+            nargs='*',
+            type=int,
+            default=[1000, 5000, 20000],
+            help='The numbers of printings to benchmark with (bookkeeping only). '
+                 'These are imported into a test database that is created for the benchmark',
+        )
+
+        parser.add_argument(
+            '--repeat',
+            dest='repeat',
+            type=int,
+            default=3,
+            help='The number of times to run each size (the fastest run is reported)',
+        )
+
+    def handle(self, *args, **options):
+        print(f'Benchmarking {options["benchmark"]}')
+
+        if options['benchmark'] == 'staging':
+            self.benchmark_staging(options['repeat'])
+            return
+
+        if options['benchmark'] == 'parsing':
+            self.benchmark_parsing(options['repeat'])
+            return
+
+        self.benchmark_bookkeeping(options['sizes'], options['repeat'])
+
+    def benchmark_bookkeeping(self, sizes, repeat):
+        """
+        Runs the set phases of update_database on generated sets against a test database,
+        so the time per printing shows how the card and set bookkeeping of the import scales
+        """
+        old_database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        # Every card and set is logged, which would take longer than the import itself
+        logger = logging.getLogger('django')
+        log_level = logger.level
+        logger.setLevel(logging.WARNING)
+
+        try:
+            for size in sizes:
+                staged_sets = self.generate_staged_sets(size)
+                reports = [self.time_import(staged_sets) for _ in range(repeat)]
+                best_time, best_report = min(reports, key=lambda report: report[0])
+
+                print(f'{size:>8} printings: {best_time:.3f}s ({best_time / size * 1e6:.2f}us per printing)')
+                for phase, stats in best_report.items():
+                    print(f'{"":>10}{phase:<28}{stats["wall_time"]:>8.3f}s {stats["query_count"]:>8} queries')
+        finally:
+            logger.setLevel(log_level)
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+    def generate_staged_sets(self, printing_count):
+        """
+        Generates sets of 250 printings, where a third of the printings are reprints of cards in earlier sets
+        :param printing_count: The total number of printings in the sets
+        :return: A list of StagedSets in release order
+        """
+        card_count = max(1, printing_count * 2 // 3)
+        staged_sets = []
+
+        for set_number, start in enumerate(range(0, printing_count, 250)):
+            set_code = f'S{set_number:04}'
+            json_cards = [{
+                'id': f'{set_code}-{i}',
+                'name': f'Card {i % card_count}',
+                'number': str(i - start + 1),
+                'artist': 'Benchmark',
+                'rarity': 'Common',
+                'layout': 'normal',
+                'manaCost': '{2}{G}',
+                'cmc': 3,
+                'colors': ['Green'],
+                'types': ['Creature'],
+                'text': f'Card {i % card_count} rules text',
+                'rulings': [{'date': '2018-01-01', 'text': f'Card {i % card_count} ruling'}],
+                'legalities': [{'format': 'Vintage', 'legality': 'Legal'}],
+            } for i in range(start, min(start + 250, printing_count))]
+
+            staged_sets.append(StagedSet({
+                'code': set_code,
+                'name': f'Benchmark Set {set_number}',
+                'releaseDate': '2018-01-01',
+                'cards': json_cards,
+            }))
+
+        return staged_sets
+
+    def time_import(self, staged_sets):
+        """
+        Imports the staged sets into the empty test database with update_database,
+        then rolls the import back so the next run starts from an empty database again
+        :return: The time taken to run the set phases, and the profiler report of each phase
+        """
+        command = UpdateDatabaseCommand()
+        command.context = ImportContext()
+
+        with transaction.atomic():
+            command.update_reference_lists(JsonImporter(use_snapshot=False))
+            command.context.profiler.phases.clear()
+
+            start_time = time.perf_counter()
+            with command.context.profiler.install(connection):
+                for staged_set in staged_sets:
+                    for phase in SET_PHASES:
+                        command.run_set_phase(phase, staged_set)
+            elapsed_time = time.perf_counter() - start_time
+
+            transaction.set_rollback(True)
+
+        return elapsed_time, command.context.profiler.get_report()
+
+    def benchmark_staging(self, repeat):
+        """
+        Stages every set in the json data file, then reads the cards of each set and their derived fields
+        as many times as update_database does
+        """
+        with open(_paths.json_data_path, 'r', encoding='utf8') as f:
+            json_sets = list(json.load(f).values())
+
+        printing_count = sum(len(json_set['cards']) for json_set in json_sets)
+        stage_times = []
+        read_times = []
+
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            staged_sets = [StagedSet(json_set) for json_set in json_sets]
+            stage_times.append(time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            # update_card_list, update_ruling_list, update_physical_card_list, update_card_links, update_legalities
+            for _ in range(5):
+                for staged_set in staged_sets:
+                    for staged_card in staged_set.get_cards():
+                        staged_card.get_name()
+                        staged_card.get_colour()
+                        staged_card.get_colour_weight()
+            read_times.append(time.perf_counter() - start_time)
+
+        print(f'{len(json_sets)} sets, {printing_count} printings')
+        print(f'Staging: {min(stage_times):.3f}s ({min(stage_times) / printing_count * 1e6:.2f}us per printing)')
+        print(f'Reading: {min(read_times):.3f}s ({min(read_times) / printing_count * 1e6:.2f}us per printing)')
+
+    def benchmark_parsing(self, repeat):
+        """
+        Compares the precompiled parsing helpers against the regular expression strings that were used
+        before, on every value in the json data file that they parse
+        """
+        with open(_paths.json_data_path, 'r', encoding='utf8') as f:
+            json_cards = [json_card for json_set in json.load(f).values() for json_card in json_set['cards']]
+
+        numbers = [json_card['number'] for json_card in json_cards if 'number' in json_card]
+        mci_numbers = [json_card['mciNumber'] for json_card in json_cards if 'mciNumber' in json_card]
+        stats = [json_card[key] for json_card in json_cards
+                 for key in ('power', 'toughness', 'loyalty') if key in json_card]
+        mana_costs = [json_card['manaCost'] for json_card in json_cards if json_card.get('manaCost')]
+        colours = [i % 32 for i in range(len(json_cards))]
+
+        def legacy():
+            for number in numbers:
+                re.search('^(?P<special>[\\D]+)?(?P<number>[\\d]+)(?P<letter>[\\D]+)?$', number)
+            for mci_number in mci_numbers:
+                re.search('^(/(?P<set>[^/]*)/(?P<lang>[^/]*)/)?(?P<num>[0-9]+)(\\.html)?$', mci_number)
+            for stat in stats:
+                re.search('(-?[\\d.]+)', str(stat))
+            for mana_cost in mana_costs:
+                re.search('(\\d+)', mana_cost)
+            for colour in colours:
+                bin(colour).count('1')
+
+        def current():
+            for number in numbers:
+                COLLECTOR_NUMBER_PATTERN.match(number)
+            for mci_number in mci_numbers:
+                MCI_NUMBER_PATTERN.match(mci_number)
+            for stat in stats:
+                NUMERIC_STAT_PATTERN.search(str(stat))
+            for mana_cost in mana_costs:
+                parse_generic_mana(mana_cost)
+            for colour in colours:
+                COLOUR_TO_COUNT[colour]
+
+        print(f'{len(json_cards)} printings')
+        for name, helpers in (('Legacy', legacy), ('Current', current)):
+            best_time = min(self.time_call(helpers) for _ in range(repeat))
+            print(f'{name}: {best_time:.3f}s ({best_time / len(json_cards) * 1e6:.2f}us per printing)')
+
+    def time_call(self, func):
+        start_time = time.perf_counter()
+        func()
+        return time.perf_counter() - start_time
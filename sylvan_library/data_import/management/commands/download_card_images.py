@@ -1,20 +1,22 @@
 from django.core.management.base import BaseCommand
 
+import logging
 import os
-import requests
-import queue
-import threading
-import random
-import time
 
 from cards.models import CardPrintingLanguage, Language
+from data_import._image_download import ImageDownloader
+
+logger = logging.getLogger('django')
+
+IMAGE_DOWNLOAD_URL = 'http://gatherer.wizards.com/Handlers/Image.ashx?multiverseid={0}&type=card'
+
+# The folder that CardPrintingLanguage image paths are relative to
+IMAGE_ROOT = 'website'
 
 
 class Command(BaseCommand):
     help = 'Downloads the MtG JSON data file'
 
-    download_thread_count = 8
-
     def add_arguments(self, parser):
         parser.add_argument(
             '--all-languages',
@@ -25,11 +27,27 @@ class Command(BaseCommand):
         )
 
         parser.add_argument(
-            '--sleepy',
-            action='store_true',
-            dest='sleep_between_downloads',
-            default=False,
-            help='Sleep a random amount between each image to prevent overloading the image server'
+            '--concurrency',
+            dest='concurrency',
+            type=int,
+            default=8,
+            help='The maximum number of images to download at the same time'
+        )
+
+        parser.add_argument(
+            '--rate-limit',
+            dest='rate_limit',
+            type=float,
+            default=10,
+            help='The maximum number of images to request from the image server per second (0 for no limit)'
+        )
+
+        parser.add_argument(
+            '--max-retries',
+            dest='max_retries',
+            type=int,
+            default=3,
+            help='The number of times to retry an image that failed to download'
         )
 
     def handle(self, *args, **options):
@@ -39,56 +57,62 @@ class Command(BaseCommand):
                   'object does not exist. Please run `update_database` first')
             return
 
-        image_download_queue = queue.Queue()
-
         card_filter = CardPrintingLanguage.objects.filter(multiverse_id__isnull=False)
         if not options['download_all_languages']:
             card_filter = card_filter.filter(language=Language.objects.get(name='English'))
 
-        for cpl in card_filter:
-            image_download_queue.put(cpl)
-
-        for i in range(1, self.download_thread_count):
-            thread = ImageDownloadThread(image_download_queue, options['sleep_between_downloads'])
-            thread.setDaemon(True)
-            thread.start()
-
-        image_download_queue.join()
-
-
-class ImageDownloadThread(threading.Thread):
-    def __init__(self, printlang_queue, random_sleep):
-        threading.Thread.__init__(self)
-        self.printlang_queue = printlang_queue
-        self.has_random_sleep = random_sleep
-
-    def run(self):
-        while True:
-            printing_language = self.printlang_queue.get()
-            download_image_for_card(printing_language, self.has_random_sleep)
-            self.printlang_queue.task_done()
-
-
-def download_image_for_card(printing_language, random_sleep):
-    image_path = printing_language.get_image_path()
-    image_path = os.path.join('website', image_path)
-
-    os.makedirs(os.path.dirname(image_path), exist_ok=True)
-
-    if os.path.exists(image_path):
-        print(f'Already downloaded {printing_language} ({printing_language.multiverse_id})')
-        return
-
-    print(f'Downloading {printing_language} ({printing_language.multiverse_id})')
-
-    image_download_url = 'http://gatherer.wizards.com' + \
-                         '/Handlers/Image.ashx?multiverseid={0}&type=card'
-
-    stream = requests.get(
-        image_download_url.format(printing_language.multiverse_id))
-
-    with open(image_path, 'wb') as output:
-        output.write(stream.content)
-
-    if random_sleep:
-        time.sleep(random.random())
+        downloaded_ids, existing_folders = self.scan_image_folder()
+        logger.info(f'{len(downloaded_ids)} images have already been downloaded')
+
+        downloader = ImageDownloader(
+            concurrency=options['concurrency'],
+            rate_limit=options['rate_limit'] or None,
+            max_retries=options['max_retries'])
+
+        downloads = self.get_downloads(card_filter.values_list('id', 'multiverse_id').iterator(),
+                                       downloaded_ids, existing_folders)
+        downloaded_count, failed_count = downloader.download_all(downloads)
+        logger.info(f'Downloaded {downloaded_count} images ({failed_count} failed)')
+
+    def scan_image_folder(self):
+        """
+        Finds every image that has already been downloaded, so they can be skipped without checking each one
+        :return: A tuple of the set of multiverse ids that have been downloaded, and the set of folders that exist
+        """
+        downloaded_ids = set()
+        existing_folders = set()
+
+        image_folder = os.path.join(IMAGE_ROOT, 'static', 'card_images')
+        for folder, _, file_names in os.walk(image_folder):
+            existing_folders.add(folder)
+
+            for file_name in file_names:
+                multiverse_id, extension = os.path.splitext(file_name)
+                if extension == '.jpg' and multiverse_id.isdigit():
+                    downloaded_ids.add(int(multiverse_id))
+
+        return downloaded_ids, existing_folders
+
+    def get_downloads(self, printing_languages, downloaded_ids, existing_folders):
+        """
+        Yields the url and path of each image that hasn't been downloaded yet.
+        Each folder is only created the first time an image is downloaded to it
+        :param printing_languages: An iterable of (id, multiverse_id) tuples of the printing languages to download
+        :param downloaded_ids: The multiverse ids of the images that have already been downloaded
+        :param existing_folders: The image folders that already exist
+        """
+        for printlang_id, multiverse_id in printing_languages:
+            # Printing languages can share the same image, so it is marked as downloaded as soon as it is queued
+            if multiverse_id in downloaded_ids:
+                continue
+            downloaded_ids.add(multiverse_id)
+
+            image_path = os.path.join(IMAGE_ROOT, CardPrintingLanguage.get_multiverse_image_path(multiverse_id))
+
+            image_folder = os.path.dirname(image_path)
+            if image_folder not in existing_folders:
+                os.makedirs(image_folder, exist_ok=True)
+                existing_folders.add(image_folder)
+
+            logger.info(f'Downloading {multiverse_id} (printing language {printlang_id})')
+            yield IMAGE_DOWNLOAD_URL.format(multiverse_id), image_path
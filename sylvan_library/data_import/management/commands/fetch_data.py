@@ -2,48 +2,69 @@ from django.core.management.base import BaseCommand
 
 import json
 import logging
-import requests
 import zipfile
 from os import path
 
-from data_import import _paths, _query
+from data_import import _paths
+from data_import._download import download_file
 
 
 class Command(BaseCommand):
     help = 'Downloads the MtG JSON data file'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Downloads and extracts the json data even if it hasn\'t changed since it was last downloaded',
+        )
+
+        parser.add_argument(
+            '--pretty',
+            action='store_true',
+            dest='pretty',
+            default=False,
+            help='Also writes an indented copy of the json data with sorted keys, which is easier to read',
+        )
+
     def handle(self, *args, **options):
 
-        if path.isfile(_paths.json_data_path):
-            overwrite = _query.query_yes_no(
-                '{0} already exists, overwrite?'.format(_paths.json_zip_path))
+        changed = download_file(_paths.json_zip_download_url, _paths.json_zip_path, _paths.json_zip_metadata_path,
+                                force=options['force'])
 
-            if not overwrite:
-                logging.info('The file {0} wasn''t overwritten'
-                             .format(_paths.json_zip_path))
-                return
+        if not changed and path.isfile(_paths.json_data_path):
+            logging.info('The json data is already up to date')
+        else:
+            logging.info('Extracting {0}'.format(_paths.json_zip_path))
+            json_zip_file = zipfile.ZipFile(_paths.json_zip_path)
+            json_zip_file.extractall(_paths.data_folder)
 
-        logging.info('Downloading json file from {0}'
-                     .format(_paths.json_zip_download_url))
-        stream = requests.get(_paths.json_zip_download_url)
+        if options['pretty'] and self.is_pretty_json_stale():
+            self.write_pretty_json()
 
-        logging.info('Writing json data to file {0}'
-                     .format(_paths.json_zip_path))
-        with open(_paths.json_zip_path, 'wb') as output:
-            output.write(stream.content)
+    def is_pretty_json_stale(self):
+        """
+        Checks whether the pretty json file needs to be written, which is when it is missing or older than the json data
+        (e.g. when the json data was updated by an earlier run without --pretty)
+        """
+        if not path.isfile(_paths.pretty_json_path):
+            return True
 
-        json_zip_file = zipfile.ZipFile(_paths.json_zip_path)
-        json_zip_file.extractall(_paths.data_folder)
+        return path.getmtime(_paths.pretty_json_path) < path.getmtime(_paths.json_data_path)
 
-        f = open(_paths.json_data_path, 'r', encoding="utf8")
-        json_data = json.load(f, encoding='UTF-8')
-        f.close()
+    def write_pretty_json(self):
+        """
+        Writes the pretty json file a piece at a time,
+        so that the whole of it never has to be held in memory as a single string
+        """
+        logging.info('Writing {0}'.format(_paths.pretty_json_path))
 
-        pretty_file = open(_paths.pretty_json_path, 'w', encoding='utf8')
-        pretty_file.write(json.dumps(
-                           json_data,
-                           sort_keys=True,
-                           indent=2,
-                           separators=(',', ': ')))
+        with open(_paths.json_data_path, 'r', encoding='utf8') as f:
+            json_data = json.load(f)
 
-        pretty_file.close()
+        encoder = json.JSONEncoder(sort_keys=True, indent=2, separators=(',', ': '))
+        with open(_paths.pretty_json_path, 'w', encoding='utf8') as pretty_file:
+            for chunk in encoder.iterencode(json_data):
+                pretty_file.write(chunk)
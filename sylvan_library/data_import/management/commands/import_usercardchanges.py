@@ -1,12 +1,14 @@
 from datetime import datetime
+from itertools import islice
 from pytz import utc
 import logging
 
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import transaction
 
-from cards.models import Card, CardPrinting, CardPrintingLanguage
-from cards.models import UserCardChange, Set, Language, PhysicalCard
+from cards.models import UserCardChange
+from data_import._user_cards import ImportErrorReport, get_physical_card_map
 
 logger = logging.getLogger('django')
 
@@ -20,12 +22,33 @@ class Command(BaseCommand):
         parser.add_argument('username', nargs=1, type=str)
         parser.add_argument('filename', nargs=1, type=str)
 
+        parser.add_argument(
+            '--chunk-size',
+            dest='chunk_size',
+            type=int,
+            default=10000,
+            help='The number of lines to read and write at a time',
+        )
+
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            dest='sync',
+            default=False,
+            help='Only writes the differences between the file and the user\'s current changes, '
+                 'instead of replacing them all',
+        )
+
+        parser.add_argument(
+            '--error-report',
+            dest='error_report',
+            help='Writes the lines that could not be imported to the given file',
+        )
+
     def handle(self, *args, **options):
 
         filename = options.get('filename')[0]
 
-        english = Language.objects.get(name='English')
-
         try:
             user = User.objects.get(username=options.get('username')[0])
         except User.DoesNotExist:
@@ -33,46 +56,112 @@ class Command(BaseCommand):
                 options.get('username')[0]))
             return
 
-        user.card_changes.all().delete()
-
-        with open(filename, 'r') as f:
-
-            for line in f:
-
-                logger.info(line)
+        self.physical_card_map = get_physical_card_map()
+        self.added_changes = set()
+        self.errors = ImportErrorReport()
+
+        change_count = 0
+
+        with transaction.atomic():
+            if options['sync']:
+                existing_changes = self.get_existing_changes(user)
+            else:
+                user.card_changes.all().delete()
+
+            with open(filename, 'r') as f:
+                lines = enumerate(f, 1)
+                while True:
+                    chunk = list(islice(lines, options['chunk_size']))
+                    if not chunk:
+                        break
+
+                    changes = self.read_changes(chunk, user)
+                    if options['sync']:
+                        changes = self.remove_existing_changes(changes, existing_changes)
+
+                    UserCardChange.objects.bulk_create(changes)
+                    change_count += len(changes)
+                    logger.info(f'Imported {change_count} card changes')
+
+            if options['sync']:
+                # Anything that wasn't matched by a line in the file has been removed from it
+                change_ids = [change_id for change_ids in existing_changes.values() for change_id in change_ids]
+                for start in range(0, len(change_ids), options['chunk_size']):
+                    UserCardChange.objects.filter(id__in=change_ids[start:start + options['chunk_size']]).delete()
+                logger.info(f'Deleted {len(change_ids)} card changes')
+
+        self.errors.log(logger)
+        if options['error_report']:
+            self.errors.write(options['error_report'])
+
+    def get_existing_changes(self, user: User):
+        """
+        Gets the ids of the changes that a user already has
+        :param user: The user who made the changes
+        :return: A dict of lists of change ids keyed by (physical card id, date, difference)
+        """
+        existing_changes = {}
+        for change_id, physical_card_id, date, difference in \
+                user.card_changes.values_list('id', 'physical_card_id', 'date', 'difference').iterator():
+            existing_changes.setdefault((physical_card_id, date, difference), []).append(change_id)
+
+        return existing_changes
+
+    def remove_existing_changes(self, changes, existing_changes):
+        """
+        Removes the changes that the user already has from a list of new changes.
+        Each existing change can only match a single new change, so any duplicates of it are deleted
+        :param changes: The new changes
+        :param existing_changes: The ids of the existing changes keyed by (physical card id, date, difference),
+        which have the matched changes removed from them
+        :return: The changes that don't exist yet
+        """
+        new_changes = []
+        for change in changes:
+            change_ids = existing_changes.get((change.physical_card_id, change.date, change.difference))
+            if change_ids:
+                change_ids.pop()
+            else:
+                new_changes.append(change)
+
+        return new_changes
+
+    def read_changes(self, lines, user: User):
+        """
+        Parses a chunk of lines from the change file
+        :param lines: A list of (line_number, line) tuples
+        :param user: The user who made the changes
+        :return: The new UserCardChange objects for the lines
+        """
+        changes = []
+
+        for line_number, line in lines:
+            try:
                 (name, setcode, datestr, number) = line.rstrip().split('\t')
-                date = datetime.strptime(datestr, '%Y-%m-%d %H:%M:%S')
-                date = utc.localize(date)
-
-                card = Card.objects.get(name=name)
-                logger.info(f'Card: {card}')
-
-                cardset = Set.objects.get(code=setcode)
-                logger.info(f'Set: {cardset}')
-
-                printing = CardPrinting.objects.filter(
-                    card=card,
-                    set=cardset).first()
-                logger.info(f'CardPrinting: {printing}')
-
-                printlang = CardPrintingLanguage.objects.get(
-                    card_printing=printing,
-                    language=english)
-                logger.info(f'CardPrintingLanguage: {printlang}')
-
-                physcards = PhysicalCard.objects.filter(
-                    printed_languages=printlang)
-
-                if UserCardChange.objects.filter(
-                        physical_card__in=physcards,
-                        owner=user, date=date, difference=number).exists():
-                    logger.info('Other half of this card already has been added')
-                    continue
-
-                for phys in physcards:
-                    usercard = UserCardChange(
-                        physical_card=phys,
-                        difference=number,
-                        owner=user,
-                        date=date)
-                    usercard.save()
+                date = utc.localize(datetime.strptime(datestr, '%Y-%m-%d %H:%M:%S'))
+                difference = int(number)
+            except ValueError:
+                self.errors.add(line_number, line, 'Expected a card name, set code, date and difference')
+                continue
+
+            physical_card_ids = self.physical_card_map.get((name, setcode))
+            if not physical_card_ids:
+                self.errors.add(line_number, line, f'Cannot find {name} in {setcode}')
+                continue
+
+            # Each half of a multi-faced card is on its own line, but only one change should be added for them,
+            # and a change that is in the file more than once is only added once
+            keys = [(physical_card_id, date, difference) for physical_card_id in physical_card_ids]
+            if any(key in self.added_changes for key in keys):
+                logger.info(f'A change of {difference} to {name} at {datestr} has already been added')
+                continue
+            self.added_changes.update(keys)
+
+            for physical_card_id in physical_card_ids:
+                changes.append(UserCardChange(
+                    physical_card_id=physical_card_id,
+                    difference=difference,
+                    owner=user,
+                    date=date))
+
+        return changes
@@ -4,6 +4,8 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from cards.models import *
+from data_import._bulk import bulk_update
+from data_import._user_cards import ImportErrorReport, get_physical_card_map
 
 logger = logging.getLogger('django')
 
@@ -17,11 +19,25 @@ class Command(BaseCommand):
         parser.add_argument('username', nargs=1, type=str, help='The user to who owns teh cards')
         parser.add_argument('filename', nargs=1, type=str, help='The file to import the cards from')
 
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            dest='sync',
+            default=False,
+            help='Only writes the differences between the file and the user\'s current cards, '
+                 'instead of replacing them all',
+        )
+
+        parser.add_argument(
+            '--error-report',
+            dest='error_report',
+            help='Writes the lines that could not be imported to the given file',
+        )
+
     def handle(self, *args, **options):
 
         filename = options.get('filename')[0]
         username = options.get('username')[0]
-        english = Language.objects.get(name='English')
 
         try:
             user = User.objects.get(username=username)
@@ -29,41 +45,83 @@ class Command(BaseCommand):
             logger.error(f'Cannot find user with name {username}')
             return
 
-        with(transaction.atomic()):
-            user.owned_cards.all().delete()
+        errors = ImportErrorReport()
+        owned_counts = self.read_owned_cards(filename, errors)
 
-            with open(filename, 'r') as f:
-                for line in f:
+        with(transaction.atomic()):
+            if options['sync']:
+                self.sync_owned_cards(user, owned_counts)
+            else:
+                user.owned_cards.all().delete()
+
+                UserOwnedCard.objects.bulk_create(
+                    [UserOwnedCard(physical_card_id=physical_card_id, count=count, owner=user)
+                     for physical_card_id, count in owned_counts.items()],
+                    batch_size=1000)
+
+                logger.info(f'Imported {len(owned_counts)} owned cards for {username}')
+
+        errors.log(logger)
+        if options['error_report']:
+            errors.write(options['error_report'])
+
+    def sync_owned_cards(self, user: User, owned_counts):
+        """
+        Changes the cards that a user owns to match the file, only writing the cards that have changed
+        :param user: The user who owns the cards
+        :param owned_counts: The number of each physical card that is owned in the file, keyed by physical card id
+        """
+        existing_cards = {owned_card.physical_card_id: owned_card for owned_card in user.owned_cards.all()}
+
+        cards_to_create = []
+        cards_to_update = []
+        for physical_card_id, count in owned_counts.items():
+            owned_card = existing_cards.pop(physical_card_id, None)
+            if owned_card is None:
+                cards_to_create.append(UserOwnedCard(physical_card_id=physical_card_id, count=count, owner=user))
+            elif owned_card.count != count:
+                owned_card.count = count
+                cards_to_update.append(owned_card)
+
+        # Anything left over is no longer in the file
+        UserOwnedCard.objects.filter(id__in=[owned_card.id for owned_card in existing_cards.values()]).delete()
+        UserOwnedCard.objects.bulk_create(cards_to_create, batch_size=1000)
+        bulk_update(UserOwnedCard, cards_to_update, ['count'], batch_size=1000)
+
+        logger.info(f'Synced owned cards for {user.username}: {len(cards_to_create)} created, '
+                    f'{len(cards_to_update)} updated, {len(existing_cards)} deleted')
+
+    def read_owned_cards(self, filename, errors: ImportErrorReport):
+        """
+        Reads the owned cards from a tab separated file of card names, counts and set codes
+        :param filename: The file to read
+        :param errors: The report to add the lines that can't be imported to
+        :return: A dict of the number of each physical card that is owned, keyed by physical card id
+        """
+        rows = []
+        with open(filename, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
                     (name, number, setcode) = line.rstrip().split('\t')
+                    rows.append((line_number, line, name, int(number), setcode))
+                except ValueError:
+                    errors.add(line_number, line, 'Expected a card name, count and set code')
+
+        physical_card_map = get_physical_card_map({name for _, _, name, _, _ in rows})
+
+        owned_counts = {}
+        for line_number, line, name, count, setcode in rows:
+            physical_card_ids = physical_card_map.get((name, setcode))
+            if not physical_card_ids:
+                errors.add(line_number, line, f'Cannot find {name} in {setcode}')
+                continue
+
+            # Each half of a multi-faced card is on its own line, but they share the same physical card
+            if any(physical_card_id in owned_counts for physical_card_id in physical_card_ids):
+                logger.info(f'Other half of {name} has already been added')
+                continue
+
+            for physical_card_id in physical_card_ids:
+                owned_counts[physical_card_id] = count
 
-                    card = Card.objects.get(name=name)
-                    logger.info(f'Card ID: {card.id}')
-
-                    cardset = Set.objects.get(code=setcode)
-                    logger.info(f'Set ID: {cardset.id}')
-
-                    printing = CardPrinting.objects.filter(
-                        card=card,
-                        set=cardset).first()
-                    logger.info(f'CardPrinting ID: {printing.id}')
-
-                    printlang = CardPrintingLanguage.objects.get(
-                        card_printing=printing,
-                        language=english)
-                    logger.info(f'CardPrintingLanguage ID: {printlang.id}')
-
-                    physcards = PhysicalCard.objects.filter(
-                        printed_languages=printlang)
-
-                    if UserOwnedCard.objects.filter(
-                            physical_card__in=physcards,
-                            owner=user).exists():
-                        logger.info('Other half of this card already has been added')
-                        continue
-
-                    for phys in physcards:
-                        usercard = UserOwnedCard(
-                            physical_card=phys,
-                            count=number,
-                            owner=user)
-                        usercard.save()
+        return owned_counts
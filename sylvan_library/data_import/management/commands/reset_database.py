@@ -1,13 +1,42 @@
+from django.apps import apps
 from django.core.management.base import BaseCommand
 
 from cards.models import *
 from django.db import connection
 from data_import import _query
 
+# The models that hold the data that users have entered themselves
+USER_MODELS = [DeckCard, Deck, CardTag, CardTag.cards.through, UserCardChange, UserOwnedCard]
+
+# The catalogue models that user data refers to, either directly or through the links from printing languages
+# to physical cards. These are kept with --keep-users-data so the user data still points at the same cards
+USER_REFERENCED_MODELS = [
+    Card, PhysicalCard, CardPrinting, CardPrintingLanguage, CardPrintingLanguage.physical_cards.through,
+    Set, Block, Rarity, Language,
+]
+
 
 class Command(BaseCommand):
     help = 'Downloads the MtG JSON data file'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fast',
+            action='store_true',
+            dest='fast',
+            default=False,
+            help='Empties all the tables with a single TRUNCATE instead of deleting their rows through the ORM',
+        )
+
+        parser.add_argument(
+            '--keep-users-data',
+            action='store_true',
+            dest='keep_users_data',
+            default=False,
+            help='Keeps decks, tags and owned cards, and the cards they refer to. '
+                 'Run update_database --update-all afterwards to refresh the catalogue',
+        )
+
     def truncate_model(self, model_obj):
         print('Truncating {0}... '.format(model_obj.__name__), end='')
         model_obj.objects.all().delete()
@@ -19,29 +48,68 @@ class Command(BaseCommand):
             cursor.execute(f"SELECT setval(pg_get_serial_sequence('\"{table_name}\"','id'), 1, false);")
 
     def handle(self, *args, **options):
-        confirm = _query.query_yes_no(
-            'Are you sure you want to delete all data in the database?', 'no')
+        if options['keep_users_data']:
+            question = 'Are you sure you want to delete all card data that isn\'t used by users?'
+        else:
+            question = 'Are you sure you want to delete all data in the database?'
+
+        confirm = _query.query_yes_no(question, 'no')
 
         if not confirm:
             return
 
-        self.truncate_model(DeckCard)
-        self.truncate_model(Deck)
-        self.truncate_model(CardTag)
-        self.truncate_model(CardRuling)
-        self.truncate_model(CardLegality)
-        self.truncate_model(UserCardChange)
-        self.truncate_model(UserOwnedCard)
-        self.truncate_model(PhysicalCard)
-        self.truncate_model(CardPrintingLanguage)
-        self.truncate_model(CardPrinting)
-        self.truncate_model(Card)
-        self.truncate_model(Rarity)
-        self.truncate_model(Set)
-        self.truncate_model(Block)
-        self.truncate_model(Format)
-        self.truncate_model(Language)
-        self.truncate_model(Colour)
-
-        self.reset_sequence('cards_card_links')
-        self.reset_sequence('cards_cardprintinglanguage_physical_cards')
+        if options['fast']:
+            self.truncate_tables(options['keep_users_data'])
+        elif options['keep_users_data']:
+            self.truncate_model(CardRuling)
+            self.truncate_model(CardLegality)
+            self.truncate_model(Format)
+            self.truncate_model(Colour)
+            Card.links.through.objects.all().delete()
+            self.reset_sequence('cards_card_links')
+        else:
+            self.truncate_model(DeckCard)
+            self.truncate_model(Deck)
+            self.truncate_model(CardTag)
+            self.truncate_model(CardRuling)
+            self.truncate_model(CardLegality)
+            self.truncate_model(UserCardChange)
+            self.truncate_model(UserOwnedCard)
+            self.truncate_model(PhysicalCard)
+            self.truncate_model(CardPrintingLanguage)
+            self.truncate_model(CardPrinting)
+            self.truncate_model(Card)
+            self.truncate_model(Rarity)
+            self.truncate_model(Set)
+            self.truncate_model(Block)
+            self.truncate_model(Format)
+            self.truncate_model(Language)
+            self.truncate_model(Colour)
+
+            self.reset_sequence('cards_card_links')
+            self.reset_sequence('cards_cardprintinglanguage_physical_cards')
+
+        if options['keep_users_data']:
+            # The rulings and legalities are gone, so every card has to be rewritten by the next update
+            Card.objects.update(fingerprint=None, rulings_hash=None)
+            CardPrinting.objects.update(fingerprint=None)
+
+    def truncate_tables(self, keep_users_data):
+        """
+        Empties the tables of the cards app (including the many to many tables) with a single TRUNCATE
+        :param keep_users_data: True if the user data and the cards it refers to should be kept
+        """
+        models = apps.get_app_config('cards').get_models(include_auto_created=True)
+        if keep_users_data:
+            models = [model for model in models if model not in USER_MODELS + USER_REFERENCED_MODELS]
+
+        table_names = ', '.join(f'"{model._meta.db_table}"' for model in models)
+        print(f'Truncating {table_names}... ', end='')
+
+        with connection.cursor() as cursor:
+            # CASCADE would also empty any kept table that refers to a truncated one,
+            # so it is left off to make the TRUNCATE fail instead of deleting data that should be kept
+            cascade = '' if keep_users_data else ' CASCADE'
+            cursor.execute(f'TRUNCATE {table_names} RESTART IDENTITY{cascade};')
+
+        print('Done')
@@ -1,38 +1,56 @@
-import logging, time
+import logging, multiprocessing, time
+from collections import OrderedDict
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from cards.models import *
 from data_import.importers import *
+from data_import._bulk import bulk_update
+from data_import._copy import CopyBuffer
+from data_import import _paths
+from data_import._import_context import ImportContext
+from data_import._locks import acquire_locks, get_set_lock_keys
+from data_import._user_cards import PhysicalCardLink
+from data_import._workers import import_set_in_worker, init_set_worker
+from data_import.models import ImportCheckpoint
 
 logger = logging.getLogger('django')
 
+# The through model of the symmetrical links between cards (e.g. the halves of a split card)
+CardLink = Card.links.through
+
+CARD_UPDATE_FIELDS = [
+    'cost', 'cmc', 'colour_flags', 'colour_identity_flags', 'colour_count', 'colour_sort_key', 'colour_weight',
+    'power', 'toughness', 'num_power', 'num_toughness', 'loyalty', 'num_loyalty',
+    'type', 'subtype', 'rules_text', 'layout', 'life_modifier', 'hand_modifier', 'is_reserved', 'fingerprint',
+]
+
+PRINTING_UPDATE_FIELDS = [
+    'collector_number', 'collector_letter', 'artist', 'rarity', 'flavour_text', 'original_text', 'original_type',
+    'mci_number', 'json_id', 'watermark', 'border_colour', 'release_date', 'is_starter', 'fingerprint',
+]
+
+# The phases of the update that are run for each set, in the order they are run
+SET_PHASES = [
+    'update_block_list',
+    'update_set_list',
+    'update_card_list',
+    'update_ruling_list',
+    'update_physical_card_list',
+    'update_card_links',
+    'update_legalities',
+]
+
+# The tables that are written with COPY during a fresh import, in the order they are written
+FRESH_MODELS = [
+    Card, CardLink, CardPrinting, CardPrintingLanguage, PhysicalCard, PhysicalCardLink, CardRuling, CardLegality,
+]
+
 
 class Command(BaseCommand):
     help = 'Downloads the MtG JSON data file'
 
-    # Keep track of which sets are new, so that printing information for existing sets doesn't have to be parsed
-    sets_to_update = []
-
-    # Keep track of which cards have been updated, so that reprints don't trigger pointless updates
-    updated_cards = []
-
-    force_update = False
-
-    update_counts = {'rarities_created': 0, 'rarities_updated': 0,
-                     'colours_created': 0, 'colours_updated': 0,
-                     'languages_created': 0, 'languages_updated': 0,
-                     'cards_created': 0, 'cards_updated': 0, 'cards_ignored': 0,
-                     'card_printings_created': 0, 'card_printings_updated': 0,
-                     'printing_languages_created': 0, 'printing_languages_skipped': 0,
-                     'physical_cards_created': 0, 'physical_cards_skipped': 0,
-                     'card_links_created': 0,
-                     'blocks_created': 0,
-                     'sets_created': 0, 'sets_updated': 0,
-                     'rulings_created': 0, 'rulings_updated': 0,
-                     'legalities_created': 0, 'legalities_updated': 0}
-
     def add_arguments(self, parser):
 
         parser.add_argument(
@@ -51,6 +69,74 @@ class Command(BaseCommand):
             help='Forces an update of sets that already exist, and cards that have already been added',
         )
 
+        parser.add_argument(
+            '--checkpoint',
+            action='store_true',
+            dest='checkpoint',
+            default=False,
+            help='Commits each phase of each set in its own transaction, and records the progress of the update',
+        )
+
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            dest='resume',
+            default=False,
+            help='Resumes a checkpointed update of the same json file, skipping the work that was completed',
+        )
+
+        parser.add_argument(
+            '--fresh',
+            action='store_true',
+            dest='fresh',
+            default=False,
+            help='Builds the card tables of an empty database in memory and writes them with COPY (PostgreSQL only)',
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            dest='batch_size',
+            type=int,
+            default=500,
+            help='The maximum number of rows to write to the database in a single query',
+        )
+
+        parser.add_argument(
+            '--workers',
+            dest='workers',
+            type=int,
+            default=1,
+            help='The number of processes to import sets in. Each set is committed in its own transaction',
+        )
+
+        parser.add_argument(
+            '--no-snapshot',
+            action='store_false',
+            dest='use_snapshot',
+            default=True,
+            help='Stages every set from the json file, instead of loading them from the snapshot of the last update',
+        )
+
+        parser.add_argument(
+            '--staging-workers',
+            dest='staging_workers',
+            type=int,
+            default=1,
+            help='The number of processes to parse and stage sets in',
+        )
+
+        parser.add_argument(
+            '--profile-report',
+            dest='profile_report',
+            help='Writes the time and query count of each phase of the update to the given json file',
+        )
+
+        parser.add_argument(
+            '--profile-dir',
+            dest='profile_dir',
+            help='Runs cProfile during the update, and writes a profile for each phase to the given folder',
+        )
+
         parser.add_argument(
             '--update-set',
             dest='force_update_sets',
@@ -60,38 +146,401 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
 
-        self.start_time = time.time()
+        importer = JsonImporter(staging_workers=options['staging_workers'], use_snapshot=options['use_snapshot'])
 
-        importer = JsonImporter()
-        importer.import_data()
+        self.context = ImportContext(
+            force_update=options['force_update'],
+            batch_size=options['batch_size'],
+            force_update_sets=options['force_update_sets'],
+            profile_dir=options['profile_dir'])
 
-        if options['force_update_sets']:
-            self.sets_to_update += options['force_update_sets']
+        update_method = self.update_database_fresh if options['fresh'] else self.update_database
 
-        self.force_update = options['force_update']
+        if options['checkpoint'] or options['resume']:
+            if options['fresh']:
+                raise CommandError('--fresh cannot be used with --checkpoint or --resume')
 
-        if options['no_transaction']:
-            self.update_database(importer)
-        else:
-            with(transaction.atomic()):
-                self.update_database(importer)
+            update_method = lambda data_importer: self.update_database_checkpointed(data_importer, options['resume'])
+
+        if options['workers'] > 1:
+            if options['fresh'] or options['checkpoint'] or options['resume']:
+                raise CommandError('--workers cannot be used with --fresh, --checkpoint or --resume')
+
+            # Each worker stages its own sets, and only the time of each phase is sent back from the workers
+            if options['staging_workers'] > 1 or options['profile_dir']:
+                raise CommandError('--workers cannot be used with --staging-workers or --profile-dir')
+
+            update_method = lambda data_importer: self.update_database_in_workers(data_importer, options)
+
+        with self.context.profiler.install(connection):
+            if options['no_transaction'] or options['checkpoint'] or options['resume'] or options['workers'] > 1:
+                update_method(importer)
+            else:
+                with(transaction.atomic()):
+                    update_method(importer)
 
         self.log_stats()
 
+        if options['profile_report']:
+            self.context.profiler.write_report(options['profile_report'])
+
+        self.context.profiler.write_profiles()
+
     def update_database(self, data_importer):
-        self.update_rarity_list(data_importer)
-        self.update_colour_list(data_importer)
-        self.update_language_list(data_importer)
+        self.update_reference_lists(data_importer)
+
+        # Sets are streamed from the json file and fully processed one at a time,
+        # so that only a single set has to be held in memory
+        for staged_set in self.iter_staged_sets(data_importer):
+            for phase in SET_PHASES:
+                self.run_set_phase(phase, staged_set)
+
+    def update_database_checkpointed(self, data_importer, resume):
+        """
+        Updates the database with each phase of each set committed in its own transaction,
+        and records each completed phase so that an interrupted update can be resumed.
+        Completed phases are skipped when the update is resumed, but the cards they updated are still recorded,
+        so reprints in later sets are skipped the same way as in an update that wasn't interrupted
+        :param data_importer: The importer to read the sets from
+        :param resume: True if phases that were completed by an earlier update should be skipped
+        """
+        source_hash = data_importer.get_source_hash()
+
+        # Checkpoints for other json files can't be resumed from
+        ImportCheckpoint.objects.exclude(source_hash=source_hash).delete()
+
+        if resume:
+            completed_phases = set(ImportCheckpoint.objects.values_list('set_code', 'phase'))
+            selected_sets = set(ImportCheckpoint.objects.filter(phase='update_set_list', set_selected=True)
+                                .values_list('set_code', flat=True))
+            logger.info(f'Resuming update with {len(completed_phases)} phases already completed')
+        else:
+            ImportCheckpoint.objects.all().delete()
+            completed_phases = set()
+            selected_sets = set()
+
+        with transaction.atomic():
+            self.update_reference_lists(data_importer)
+
+        for staged_set in self.iter_staged_sets(data_importer):
+            set_code = staged_set.get_code()
+
+            # If the update was interrupted after this set was added, then the set already exists,
+            # so if it was chosen to be updated then it has to be added to the sets to update by hand
+            if set_code in selected_sets:
+                self.context.sets_to_update.add(set_code)
+
+            for phase in SET_PHASES:
+                if (set_code, phase) in completed_phases:
+                    logger.info(f'{phase} has already been completed for {staged_set.get_name()}')
+                    self.record_completed_phase(phase, staged_set)
+                    continue
+
+                with transaction.atomic():
+                    self.run_set_phase(phase, staged_set)
+                    ImportCheckpoint.objects.create(source_hash=source_hash, set_code=set_code, phase=phase,
+                                                    set_selected=set_code in self.context.sets_to_update)
+
+        ImportCheckpoint.objects.all().delete()
+
+    def record_completed_phase(self, phase, staged_set: StagedSet):
+        """
+        Records the cards that a phase completed by an earlier update marked as updated
+        :param phase: The phase that was completed
+        :param staged_set: The set that the phase was completed for
+        """
+        if staged_set.get_code() not in self.context.sets_to_update:
+            return
+
+        card_names = {staged_card.get_name() for staged_card in staged_set.get_cards()}
+
+        if phase == 'update_card_list':
+            self.context.updated_cards.update(card_names)
+        elif phase == 'update_ruling_list':
+            self.context.ruling_updated_cards.update(card_names)
+        elif phase == 'update_legalities':
+            self.context.legality_updated_cards.update(card_names)
+
+    def update_database_in_workers(self, data_importer, options):
+        """
+        Updates the database with the sets shared between a pool of worker processes, each with its own connection.
+        Every set is imported in a single transaction that first takes an advisory lock on each card, block and format
+        that the set could write, so sets that share cards (i.e. reprints) are imported one after the other,
+        while sets that don't can be imported at the same time.
+        The sets that each card is updated from are worked out before the sets are imported,
+        so cards end up the same as when the sets are imported one at a time in release date order
+        :param data_importer: The importer to read the sets from
+        :param options: The options of the command, which are passed on to the workers
+        """
+        with transaction.atomic():
+            self.update_reference_lists(data_importer)
+
+        set_index = data_importer.index_set_cards()
+
+        card_update_sets = {}
+        card_first_sets = {}
+        for _, _, set_code, card_names in set_index:
+            if not self.will_update_set(set_code):
+                continue
+
+            for card_name in card_names:
+                card_first_sets.setdefault(card_name, set_code)
+
+                # A force update rewrites a card from every printing, so the last printing is the one that is kept
+                if self.context.force_update:
+                    card_update_sets[card_name] = set_code
+                else:
+                    card_update_sets.setdefault(card_name, set_code)
+
+        # Forked workers would otherwise share the connection of this process
+        connection.close()
+
+        worker_options = {key: options[key] for key in ('force_update', 'batch_size', 'force_update_sets')}
+
+        with multiprocessing.Pool(options['workers'], initializer=init_set_worker,
+                                  initargs=(worker_options, card_update_sets, card_first_sets)) as pool:
+            set_entries = [(offset, length) for offset, length, _, _ in set_index]
+            for update_counts, phases in pool.imap_unordered(import_set_in_worker, set_entries):
+                for key, value in update_counts.items():
+                    self.context.update_counts[key] += value
+
+                self.context.profiler.merge_phases(phases)
+
+    def will_update_set(self, set_code):
+        """
+        Checks whether update_set_list will add a set to the sets to update, before the set has been imported
+        """
+        if set_code in self.context.sets_to_update:
+            return True
+
+        # Sets that start with 'p' are skipped by update_set_list
+        if set_code[0] == 'p':
+            return False
+
+        return self.context.force_update or self.context.reference_cache.sets.find(set_code) is None
+
+    def init_worker(self, options, card_update_sets, card_first_sets):
+        """
+        Sets up this command to import sets in a worker process of update_database --workers
+        :param options: The options of update_database that the workers use
+        :param card_update_sets: The code of the set that each card is updated from, keyed by card name
+        :param card_first_sets: The code of the first set in the update that each card is in, keyed by card name
+        """
+        self.context = ImportContext(
+            force_update=options['force_update'],
+            batch_size=options['batch_size'],
+            force_update_sets=options['force_update_sets'])
+        self.context.card_update_sets = card_update_sets
+        self.context.card_first_sets = card_first_sets
+        self.context.reference_cache.load()
+
+    def import_set_entry(self, set_entry):
+        """
+        Stages and imports a single set in a worker process
+        :param set_entry: The (offset, length) of the set in the json file
+        :return: The update counts and profiler phases of the set, which are reset for the next set the worker imports
+        """
+        with self.context.profiler.install(connection):
+            with self.context.profiler.phase('stage_sets'):
+                staged_set = stage_set_from_path(_paths.json_data_path, *set_entry)
+
+            self.import_set(staged_set)
+
+        update_counts = dict(self.context.update_counts)
+        self.context.update_counts = dict.fromkeys(self.context.update_counts, 0)
+
+        phases = self.context.profiler.phases
+        self.context.profiler.phases = OrderedDict()
+
+        return update_counts, phases
+
+    def import_set(self, staged_set: StagedSet):
+        """
+        Imports a set in a worker process, holding the locks for every shared row that the set could write
+        :param staged_set: The set to import
+        """
+        with transaction.atomic():
+            with self.context.profiler.phase('acquire_locks'), connection.cursor() as cursor:
+                acquire_locks(cursor, get_set_lock_keys(staged_set))
+
+            # Another worker could have created new formats before the locks were taken
+            self.context.reference_cache.formats.load()
+
+            for phase in SET_PHASES:
+                self.run_set_phase(phase, staged_set)
+
+    def run_set_phase(self, phase, staged_set: StagedSet):
+        with self.context.profiler.phase(phase):
+            getattr(self, phase)([staged_set])
+
+    def update_reference_lists(self, data_importer):
+        with self.context.profiler.phase('update_reference_lists'):
+            self.update_rarity_list(data_importer)
+            self.update_colour_list(data_importer)
+            self.update_language_list(data_importer)
+
+            # The reference tables are loaded after they have been updated, so the cache holds the latest values
+            self.context.reference_cache.load()
+
+    def iter_staged_sets(self, data_importer):
+        """
+        Yields the staged sets from the importer, recording the time spent reading and staging them
+        """
+        staged_sets = data_importer.iter_staged_sets()
+        while True:
+            with self.context.profiler.phase('stage_sets'):
+                staged_set = next(staged_sets, None)
+
+            if staged_set is None:
+                return
+
+            yield staged_set
+
+    def update_database_fresh(self, data_importer):
+        """
+        Builds all the card tables in memory and writes each of them with a single COPY,
+        which is much faster than going through the ORM. This can only be used on an empty database
+        """
+        for model in FRESH_MODELS:
+            if model.objects.exists():
+                raise CommandError(f'{model.__name__} objects already exist. '
+                                   f'--fresh can only be used after running reset_database')
+
+        self.update_reference_lists(data_importer)
+
+        # Sets that already exist still need their cards added
+        self.context.force_update = True
+
+        tables = {model: CopyBuffer(model) for model in FRESH_MODELS}
+        card_objs = {}
+        card_links = set()
+
+        for staged_set in self.iter_staged_sets(data_importer):
+            staged_sets = [staged_set]
+
+            with self.context.profiler.phase('update_block_list'):
+                self.update_block_list(staged_sets)
+            with self.context.profiler.phase('update_set_list'):
+                self.update_set_list(staged_sets)
+
+            if staged_set.get_code() not in self.context.sets_to_update:
+                logger.info(f'Ignoring set {staged_set.get_name()}')
+                continue
+
+            logger.info(f'Staging cards in set {staged_set.get_name()}')
+            with self.context.profiler.phase('stage_fresh_set'):
+                self.stage_fresh_set(staged_set, tables, card_objs, card_links)
+
+        for from_card_id, to_card_id in card_links:
+            tables[CardLink].add(CardLink(from_card_id=from_card_id, to_card_id=to_card_id))
+        self.context.update_counts['card_links_created'] += len(card_links)
+
+        with self.context.profiler.phase('copy_tables'), connection.cursor() as cursor:
+            for model in FRESH_MODELS:
+                logger.info(f'Copying {tables[model].row_count} rows into {model._meta.db_table}')
+                tables[model].copy_to_database(cursor)
+
+    def stage_fresh_set(self, staged_set: StagedSet, tables, card_objs, card_links):
+        """
+        Adds the rows for a set to the in-memory tables
+        :param staged_set: The set to add
+        :param tables: The CopyBuffer of each model
+        :param card_objs: Every card that has been added so far, keyed by name
+        :param card_links: The (from_card_id, to_card_id) pairs of the links between cards that have been found so far
+        """
+        set_obj = self.context.reference_cache.sets.get(staged_set.get_code())
+        staged_cards = staged_set.get_cards()
+        self.assign_collector_numbers(staged_cards)
+
+        printings_by_json_id = {}
+        printings_by_card_name = {}
+        printlangs = {}
+
+        for staged_card in staged_cards:
+            card = card_objs.get(staged_card.get_name())
+            if card is None:
+                card = self.stage_fresh_card(staged_card, tables)
+                card_objs[card.name] = card
+            else:
+                self.context.update_counts['cards_ignored'] += 1
+
+            printing = CardPrinting(card=card, set=set_obj)
+            self.apply_printing_fields(printing, staged_card)
+            printing.fingerprint = staged_card.get_printing_fingerprint()
+            tables[CardPrinting].add(printing)
+            self.context.update_counts['card_printings_created'] += 1
+
+            printings_by_json_id[printing.json_id] = printing
+            printings_by_card_name.setdefault(card.name, printing)
+
+            languages = [{
+                'language': 'English',
+                'name': staged_card.get_name(),
+                'multiverseid': staged_card.get_multiverse_id()
+            }]
+            if staged_card.has_foreign_names():
+                languages += staged_card.get_foreign_names()
+
+            for lang in languages:
+                lang_obj = self.context.reference_cache.languages.get(lang['language'])
+                if (printing.id, lang_obj.id) in printlangs:
+                    self.context.update_counts['printing_languages_skipped'] += 1
+                    continue
+
+                printlang = CardPrintingLanguage(
+                    card_printing=printing,
+                    language=lang_obj,
+                    card_name=lang['name'],
+                    multiverse_id=lang.get('multiverseid'))
+                printlangs[(printing.id, lang_obj.id)] = tables[CardPrintingLanguage].add(printlang)
+                self.context.update_counts['printing_languages_created'] += 1
 
-        staged_sets = data_importer.get_staged_sets()
+            if staged_card.has_other_names():
+                for link_name in staged_card.get_other_names():
+                    link_card = card_objs.get(link_name)
+                    if link_card is not None:
+                        card_links.add((card.id, link_card.id))
+                        card_links.add((link_card.id, card.id))
+
+        physical_card_groups = self.get_physical_card_groups(
+            staged_cards, printings_by_json_id, printings_by_card_name, printlangs, set())
+
+        for physical_card, linked_printlangs in physical_card_groups:
+            tables[PhysicalCard].add(physical_card)
+            for printlang in linked_printlangs:
+                tables[PhysicalCardLink].add(
+                    PhysicalCardLink(cardprintinglanguage_id=printlang.id, physicalcard_id=physical_card.id))
+
+        self.context.update_counts['physical_cards_created'] += len(physical_card_groups)
+
+    def stage_fresh_card(self, staged_card: StagedCard, tables):
+        """
+        Adds the rows for a new card, and its rulings and legalities, to the in-memory tables
+        :param staged_card: The card to add
+        :param tables: The CopyBuffer of each model
+        :return: The new card
+        """
+        card = Card(name=staged_card.get_name())
+        self.apply_card_fields(card, staged_card)
+        card.fingerprint = staged_card.get_card_fingerprint()
+        card.rulings_hash = staged_card.get_rulings_hash()
+        tables[Card].add(card)
+        self.context.update_counts['cards_created'] += 1
+        self.context.ruling_updated_cards.add(card.name)
+        self.context.legality_updated_cards.add(card.name)
+
+        if staged_card.has_rulings():
+            for date, text in {(ruling['date'], ruling['text']) for ruling in staged_card.get_rulings()}:
+                tables[CardRuling].add(CardRuling(card_id=card.id, date=date, text=text))
+                self.context.update_counts['rulings_created'] += 1
+
+        for legality in staged_card.get_legalities():
+            format_obj, created = self.context.reference_cache.formats.get_or_create(legality['format'])
+            tables[CardLegality].add(
+                CardLegality(card_id=card.id, format_id=format_obj.id, restriction=legality['legality']))
+            self.context.update_counts['legalities_created'] += 1
 
-        self.update_block_list(staged_sets)
-        self.update_set_list(staged_sets)
-        self.update_card_list(staged_sets)
-        self.update_ruling_list(staged_sets)
-        self.update_physical_card_list(staged_sets)
-        self.update_card_links(staged_sets)
-        self.update_legalities(staged_sets)
+        return card
 
     def update_colour_list(self, data_importer):
         logger.info('Updating colour list')
@@ -100,7 +549,7 @@ class Command(BaseCommand):
             colour_obj = Colour.objects.filter(symbol=colour['symbol']).first()
             if colour_obj is not None:
                 logger.info(f'Updating existing colour {colour_obj}')
-                self.update_counts['colours_updated'] += 1
+                self.context.update_counts['colours_updated'] += 1
             else:
                 logger.info(f"Creating new colour {colour['name']}")
                 colour_obj = Colour(symbol=colour['symbol'],
@@ -108,7 +557,7 @@ class Command(BaseCommand):
                                     display_order=colour['display_order'],
                                     bit_value=colour['bit_value'])
                 colour_obj.save()
-                self.update_counts['colours_created'] += 1
+                self.context.update_counts['colours_created'] += 1
 
     def update_rarity_list(self, data_importer):
 
@@ -121,7 +570,7 @@ class Command(BaseCommand):
                 rarity_obj.name = rarity['name']
                 rarity_obj.display_order = rarity['display_order']
                 rarity_obj.save()
-                self.update_counts['rarities_updated'] += 1
+                self.context.update_counts['rarities_updated'] += 1
             else:
                 logger.info(f"Creating new rarity {rarity['name']}")
 
@@ -131,7 +580,7 @@ class Command(BaseCommand):
                     display_order=rarity['display_order'])
 
                 rarity_obj.save()
-                self.update_counts['rarities_created'] += 1
+                self.context.update_counts['rarities_created'] += 1
 
         logger.info('Rarity update complete')
 
@@ -145,12 +594,12 @@ class Command(BaseCommand):
                 logger.info(f"Updating language: {lang['name']}", )
                 language_obj.mci_code = lang['code']
                 language_obj.save()
-                self.update_counts['languages_updated'] += 1
+                self.context.update_counts['languages_updated'] += 1
             else:
                 logger.info(f"Creating new language: {lang['name']}")
                 language_obj = Language(name=lang['name'], mci_code=lang['code'])
                 language_obj.save()
-                self.update_counts['languages_created'] += 1
+                self.context.update_counts['languages_created'] += 1
 
         logger.info('Language update complete')
 
@@ -168,6 +617,13 @@ class Command(BaseCommand):
 
             if block is not None:
                 logger.info(f'Block {block.name} already exists')
+
+                # Sets can be imported out of order by update_database --workers,
+                # so the block takes the release date of the earliest set in it
+                if block.release_date.isoformat() > staged_set.get_release_date():
+                    logger.info(f'Moving the release date of {block.name} to {staged_set.get_release_date()}')
+                    block.release_date = staged_set.get_release_date()
+                    block.save()
             else:
                 block = Block(
                     name=staged_set.get_block(),
@@ -175,7 +631,7 @@ class Command(BaseCommand):
 
                 logger.info(f'Created block {block.name}')
                 block.save()
-                self.update_counts['blocks_created'] += 1
+                self.context.update_counts['blocks_created'] += 1
 
         logger.info('Block list updated')
 
@@ -189,7 +645,7 @@ class Command(BaseCommand):
                 logger.info(f'Ignoring set {s.get_name()}')
                 continue
 
-            set_obj = Set.objects.filter(code=s.get_code()).first()
+            set_obj = self.context.reference_cache.sets.find(s.get_code())
 
             if set_obj is None:
 
@@ -205,18 +661,19 @@ class Command(BaseCommand):
                     border_colour=s.get_border_colour())
 
                 set_obj.save()
-                self.update_counts['sets_created'] += 1
-                self.sets_to_update.append(s.get_code())
+                self.context.reference_cache.sets.add(set_obj)
+                self.context.update_counts['sets_created'] += 1
+                self.context.sets_to_update.add(s.get_code())
 
             else:
                 logger.info(f'Set {s.get_name()} already exists, updating')
 
                 set_obj.border_colour = s.get_border_colour()
                 set_obj.save()
-                self.update_counts['sets_updated'] += 1
+                self.context.update_counts['sets_updated'] += 1
 
-                if self.force_update:  # use the set anyway during a force update
-                    self.sets_to_update.append(s.get_code())
+                if self.context.force_update:  # use the set anyway during a force update
+                    self.context.sets_to_update.add(s.get_code())
         logger.info('Set list updated')
 
     def update_card_list(self, staged_sets):
@@ -224,61 +681,94 @@ class Command(BaseCommand):
 
         for staged_set in staged_sets:
 
-            if staged_set.get_code() not in self.sets_to_update:
+            if staged_set.get_code() not in self.context.sets_to_update:
                 logger.info(f'Ignoring set {staged_set.get_name()}')
                 continue
 
             logger.info(f'Updating cards in set {staged_set.get_name()}')
 
-            set_obj = Set.objects.get(code=staged_set.get_code())
-
-            default_collector_number = 1
-
-            for staged_card in staged_set.get_cards():
-                if staged_card.get_collector_number() is None:
-                    staged_card.set_collector_number(default_collector_number)
+            set_obj = self.context.reference_cache.sets.get(staged_set.get_code())
 
-                default_collector_number = staged_card.get_collector_number() + 1
+            staged_cards = staged_set.get_cards()
+            self.assign_collector_numbers(staged_cards)
 
-                card_obj = self.update_card(staged_card)
+            card_objs = self.update_cards(staged_cards, staged_set.get_code())
+            printing_objs = self.update_card_printings(card_objs, set_obj, staged_cards)
+            self.update_card_printing_languages(printing_objs, staged_cards)
 
-                printing_obj = self.update_card_printing(
-                    card_obj,
-                    set_obj,
-                    staged_card)
+        logger.info('Card list updated')
 
-                english = {
-                    'language': 'English',
-                    'name': staged_card.get_name(),
-                    'multiverseid': staged_card.get_multiverse_id()
-                }
+    def assign_collector_numbers(self, staged_cards):
+        """
+        Gives each card without a collector number the number after the card before it
+        """
+        default_collector_number = 1
+
+        for staged_card in staged_cards:
+            if staged_card.get_collector_number() is None:
+                staged_card.set_collector_number(default_collector_number)
+
+            default_collector_number = staged_card.get_collector_number() + 1
+
+    def update_cards(self, staged_cards, set_code):
+        """
+        Creates or updates the Card for each of the staged cards, writing them all in bulk
+        :param staged_cards: The staged cards to update
+        :param set_code: The code of the set that the staged cards are in
+        :return: A dict of every card object (including ignored ones) keyed by name
+        """
+        card_objs = {card.name: card for card in
+                     Card.objects.filter(name__in={staged_card.get_name() for staged_card in staged_cards})}
+
+        cards_to_create = []
+        cards_to_update = {}
+
+        for staged_card in staged_cards:
+            card = card_objs.get(staged_card.get_name())
+            fingerprint = staged_card.get_card_fingerprint()
+
+            if card is None:
+                card = Card(name=staged_card.get_name())
+                card_objs[card.name] = card
+                cards_to_create.append(card)
+                logger.info(f'Creating new card {card}')
+                self.context.update_counts['cards_created'] += 1
+            else:
+                if not self.context.should_update_card(staged_card.get_name(), set_code):
+                    logger.info(f'{card} is updated from another set')
+                    self.context.update_counts['cards_ignored'] += 1
+                    continue
 
-                self.update_card_printing_language(printing_obj, english)
+                # Cards created by another set in this worker still have to be updated from the set they belong to
+                if not self.context.force_update and self.context.card_update_sets is None and \
+                        staged_card.get_name() in self.context.updated_cards:
+                    logger.info(f'{card} has already been updated')
+                    self.context.update_counts['cards_ignored'] += 1
+                    continue
 
-                if staged_card.has_foreign_names():
-                    for lang in staged_card.get_foreign_names():
-                        self.update_card_printing_language(printing_obj, lang)
+                if card.fingerprint == fingerprint:
+                    logger.info(f'{card} has not changed')
+                    self.context.update_counts['cards_unchanged'] += 1
+                    self.context.updated_cards.add(staged_card.get_name())
+                    continue
 
-        logger.info('Card list updated')
+                # Cards that are created in this batch don't need to be updated as well
+                if card.pk is not None:
+                    cards_to_update[card.name] = card
 
-    def update_card(self, staged_card: StagedCard):
-        card = Card.objects.filter(name=staged_card.get_name()).first()
+                logger.info(f'Updating existing card {card}')
+                self.context.update_counts['cards_updated'] += 1
 
-        if card is not None:
-            if not self.force_update and staged_card.get_name() in self.updated_cards:
-                logger.info(f'{card} has already been updated')
-                self.update_counts['cards_ignored'] += 1
-                return card
+            self.context.updated_cards.add(staged_card.get_name())
+            self.apply_card_fields(card, staged_card)
+            card.fingerprint = fingerprint
 
-            logger.info(f'Updating existing card {card}')
-            self.update_counts['cards_updated'] += 1
-        else:
-            card = Card(name=staged_card.get_name())
-            logger.info(f'Creating new card {card}')
-            self.update_counts['cards_created'] += 1
+        Card.objects.bulk_create(cards_to_create, batch_size=self.context.batch_size)
+        bulk_update(Card, cards_to_update.values(), CARD_UPDATE_FIELDS, batch_size=self.context.batch_size)
 
-        self.updated_cards.append(staged_card.get_name())
+        return card_objs
 
+    def apply_card_fields(self, card: Card, staged_card: StagedCard):
         card.cost = staged_card.get_mana_cost()
         card.cmc = staged_card.get_cmc()
         card.colour_flags = staged_card.get_colour()
@@ -307,29 +797,58 @@ class Command(BaseCommand):
 
         card.is_reserved = staged_card.is_reserved()
 
-        card.save()
-        return card
+    def update_card_printings(self, card_objs, set_obj: Set, staged_cards):
+        """
+        Creates or updates the CardPrinting for each of the staged cards, writing them all in bulk
+        :param card_objs: The dict of card objects keyed by name that the printings belong to
+        :param set_obj: The set that the printings are in
+        :param staged_cards: The staged cards to update
+        :return: A dict of the card printings keyed by json_id
+        """
+        printing_objs = {printing.json_id: printing for printing in
+                         CardPrinting.objects.filter(
+                             json_id__in=[staged_card.get_json_id() for staged_card in staged_cards])}
+
+        printings_to_create = []
+        printings_to_update = []
+
+        for staged_card in staged_cards:
+            printing = printing_objs.get(staged_card.get_json_id())
+            fingerprint = staged_card.get_printing_fingerprint()
+
+            if printing is not None:
+                if printing.fingerprint == fingerprint:
+                    logger.info(f'Card printing {printing} has not changed')
+                    self.context.update_counts['card_printings_unchanged'] += 1
+                    continue
 
-    def update_card_printing(self, card_obj: Card, set_obj: Set, staged_card: StagedCard):
+                logger.info(f'Updating card printing {printing}')
+                printings_to_update.append(printing)
+                self.context.update_counts['card_printings_updated'] += 1
+            else:
+                printing = CardPrinting(
+                    card=card_objs[staged_card.get_name()],
+                    set=set_obj,
+                )
+                printing_objs[staged_card.get_json_id()] = printing
+                printings_to_create.append(printing)
+                logger.info(f'Created new card printing {printing}')
+                self.context.update_counts['card_printings_created'] += 1
 
-        printing = CardPrinting.objects.filter(json_id=staged_card.get_json_id()).first()
+            self.apply_printing_fields(printing, staged_card)
+            printing.fingerprint = fingerprint
 
-        if printing is not None:
-            logger.info(f'Updating card printing {printing}')
-            self.update_counts['card_printings_updated'] += 1
-        else:
-            printing = CardPrinting(
-                card=card_obj,
-                set=set_obj,
-            )
-            logger.info(f'Created new card printing {printing}')
-            self.update_counts['card_printings_created'] += 1
+        CardPrinting.objects.bulk_create(printings_to_create, batch_size=self.context.batch_size)
+        bulk_update(CardPrinting, printings_to_update, PRINTING_UPDATE_FIELDS, batch_size=self.context.batch_size)
 
+        return printing_objs
+
+    def apply_printing_fields(self, printing: CardPrinting, staged_card: StagedCard):
         printing.collector_number = staged_card.get_collector_number()
         printing.collector_letter = staged_card.get_collector_letter()
 
         printing.artist = staged_card.get_artist()
-        printing.rarity = Rarity.objects.get(name=staged_card.get_rarity_name())
+        printing.rarity = self.context.reference_cache.rarities.get(staged_card.get_rarity_name())
 
         printing.flavour_text = staged_card.get_flavour_text()
         printing.original_text = staged_card.get_original_text()
@@ -341,198 +860,357 @@ class Command(BaseCommand):
         printing.release_date = staged_card.get_release_date()
         printing.is_starter = staged_card.is_starter_printing()
 
-        printing.save()
-
-        return printing
-
-    def update_card_printing_language(self, printing_obj, lang):
-        lang_obj = Language.objects.get(name=lang['language'])
+    def update_card_printing_languages(self, printing_objs, staged_cards):
+        """
+        Creates the CardPrintingLanguages for each of the staged cards that don't exist yet
+        :param printing_objs: The dict of card printings keyed by json_id
+        :param staged_cards: The staged cards to update
+        """
+        existing_printlangs = set(
+            CardPrintingLanguage.objects.filter(card_printing__in=printing_objs.values())
+                .values_list('card_printing_id', 'language_id'))
+
+        printlangs_to_create = []
+
+        for staged_card in staged_cards:
+            printing_obj = printing_objs[staged_card.get_json_id()]
+
+            english = {
+                'language': 'English',
+                'name': staged_card.get_name(),
+                'multiverseid': staged_card.get_multiverse_id()
+            }
+
+            languages = [english]
+            if staged_card.has_foreign_names():
+                languages += staged_card.get_foreign_names()
+
+            for lang in languages:
+                lang_obj = self.context.reference_cache.languages.get(lang['language'])
+
+                if (printing_obj.id, lang_obj.id) in existing_printlangs:
+                    logger.info(f'Card printing language {lang_obj} {printing_obj} already exists')
+                    self.context.update_counts['printing_languages_skipped'] += 1
+                    continue
 
-        cardlang = CardPrintingLanguage.objects.filter(
-            card_printing_id=printing_obj.id,
-            language_id=lang_obj.id).first()
+                existing_printlangs.add((printing_obj.id, lang_obj.id))
 
-        if cardlang is not None:
-            logger.info(f'Card printing language {cardlang} already exists')
-            self.update_counts['printing_languages_skipped'] += 1
-            return cardlang
+                cardlang = CardPrintingLanguage(
+                    card_printing=printing_obj,
+                    language=lang_obj,
+                    card_name=lang['name'],
+                    multiverse_id=lang.get('multiverseid'))
 
-        cardlang = CardPrintingLanguage(
-            card_printing=printing_obj,
-            language=lang_obj,
-            card_name=lang['name'],
-            multiverse_id=lang.get('multiverseid'))
+                logger.info(f'Created new printing language {cardlang}', )
+                printlangs_to_create.append(cardlang)
+                self.context.update_counts['printing_languages_created'] += 1
 
-        logger.info(f'Created new printing language {cardlang}', )
-        cardlang.save()
-        self.update_counts['printing_languages_created'] += 1
-        return cardlang
+        CardPrintingLanguage.objects.bulk_create(printlangs_to_create, batch_size=self.context.batch_size)
 
     def update_ruling_list(self, staged_sets):
         logger.info('Updating card rulings')
-        CardRuling.objects.all().delete()
 
         for staged_set in staged_sets:
 
-            if staged_set.get_code() not in self.sets_to_update:
+            if staged_set.get_code() not in self.context.sets_to_update:
                 logger.info(f'Ignoring set {staged_set.get_name()}')
                 continue
 
             logger.info(f'Updating rulings in {staged_set.get_name()}')
 
+            staged_cards = {}
             for staged_card in staged_set.get_cards():
+                if staged_card.get_name() not in self.context.ruling_updated_cards and \
+                        self.context.is_first_printing(staged_card.get_name(), staged_set.get_code()):
+                    staged_cards.setdefault(staged_card.get_name(), staged_card)
+
+            self.context.ruling_updated_cards.update(staged_cards.keys())
 
-                if not staged_card.has_rulings():
+            changed_cards = []
+            for card_obj in Card.objects.filter(name__in=staged_cards.keys()):
+                rulings_hash = staged_cards[card_obj.name].get_rulings_hash()
+                if card_obj.rulings_hash == rulings_hash:
+                    self.context.update_counts['ruling_cards_unchanged'] += 1
                     continue
 
-                card_obj = Card.objects.get(name=staged_card.get_name())
-                logger.info(f'Updating rulings for {staged_card.get_name()}')
+                logger.info(f'Updating rulings for {card_obj}')
+                card_obj.rulings_hash = rulings_hash
+                changed_cards.append(card_obj)
 
-                for ruling in staged_card.get_rulings():
-                    ruling, created = CardRuling.objects.get_or_create(card=card_obj, text=ruling['text'],
-                                                                       date=ruling['date'])
-                    self.update_counts['rulings_created' if created else 'rulings_updated'] += 1
+            if changed_cards:
+                self.update_card_rulings(changed_cards, staged_cards)
 
         logger.info('Card rulings updated')
 
+    def update_card_rulings(self, card_objs, staged_cards):
+        """
+        Brings the rulings of each card in line with the staged cards, only adding and removing
+        the rulings that have changed
+        :param card_objs: The cards that have had their rulings changed
+        :param staged_cards: The staged cards keyed by name
+        """
+        existing_rulings = {
+            (card_id, date.isoformat(), text): ruling_id
+            for ruling_id, card_id, date, text in
+            CardRuling.objects.filter(card__in=card_objs).values_list('id', 'card_id', 'date', 'text')}
+
+        staged_rulings = set()
+        for card_obj in card_objs:
+            staged_card = staged_cards[card_obj.name]
+            if staged_card.has_rulings():
+                staged_rulings.update((card_obj.id, ruling['date'], ruling['text'])
+                                      for ruling in staged_card.get_rulings())
+
+        rulings_to_delete = [ruling_id for key, ruling_id in existing_rulings.items() if key not in staged_rulings]
+        rulings_to_create = [CardRuling(card_id=card_id, date=date, text=text)
+                             for card_id, date, text in staged_rulings
+                             if (card_id, date, text) not in existing_rulings]
+
+        CardRuling.objects.filter(id__in=rulings_to_delete).delete()
+        CardRuling.objects.bulk_create(rulings_to_create, batch_size=self.context.batch_size)
+        bulk_update(Card, card_objs, ['rulings_hash'], batch_size=self.context.batch_size)
+
+        self.context.update_counts['rulings_deleted'] += len(rulings_to_delete)
+        self.context.update_counts['rulings_created'] += len(rulings_to_create)
+
     def update_physical_card_list(self, staged_sets):
         logger.info('Updating physical card list')
 
-        english_language = Language.objects.get(name='English')
         for staged_set in staged_sets:
 
-            if staged_set.get_code() not in self.sets_to_update:
+            if staged_set.get_code() not in self.context.sets_to_update:
                 logger.info(f'Skipping set {staged_set.get_name()}')
                 continue
 
-            set_obj = Set.objects.get(code=staged_set.get_code())
-
-            for staged_card in staged_set.get_cards():
-                card_obj = Card.objects.get(name=staged_card.get_name())
-
-                printing_obj = CardPrinting.objects.get(json_id=staged_card.get_json_id())
-
-                printlang_obj = CardPrintingLanguage.objects.get(
-                    card_printing=printing_obj,
-                    language=english_language)
-
-                self.update_physical_card(printlang_obj, staged_card)
-
-                if staged_card.has_foreign_names():
-                    for card_language in staged_card.get_foreign_names():
-                        lang_obj = Language.objects.get(
-                            name=card_language['language'])
-
-                        printlang_obj = CardPrintingLanguage.objects.get(
-                            card_printing=printing_obj,
-                            language=lang_obj)
-
-                        self.update_physical_card(printlang_obj, staged_card)
+            logger.info(f'Updating physical cards in {staged_set.get_name()}')
+
+            set_obj = self.context.reference_cache.sets.get(staged_set.get_code())
+
+            printings = CardPrinting.objects.filter(set=set_obj).select_related('card', 'set').order_by('id')
+            printings_by_json_id = {}
+            printings_by_card_name = {}
+            for printing in printings:
+                printings_by_json_id[printing.json_id] = printing
+                printings_by_card_name.setdefault(printing.card.name, printing)
+
+            # The related objects are selected as they are used when the printing languages are logged
+            printlangs = {(printlang.card_printing_id, printlang.language_id): printlang
+                          for printlang in CardPrintingLanguage.objects.filter(card_printing__set=set_obj)
+                              .select_related('language', 'card_printing__card', 'card_printing__set')}
+
+            # Printing languages that already belong to a physical card
+            linked_printlang_ids = set(
+                PhysicalCardLink.objects.filter(cardprintinglanguage__card_printing__set=set_obj)
+                    .values_list('cardprintinglanguage_id', flat=True))
+
+            physical_card_groups = self.get_physical_card_groups(
+                staged_set.get_cards(), printings_by_json_id, printings_by_card_name, printlangs, linked_printlang_ids)
+
+            PhysicalCard.objects.bulk_create([physical_card for physical_card, _ in physical_card_groups],
+                                             batch_size=self.context.batch_size)
+
+            PhysicalCardLink.objects.bulk_create(
+                [PhysicalCardLink(cardprintinglanguage_id=printlang.id, physicalcard_id=physical_card.id)
+                 for physical_card, linked_printlangs in physical_card_groups
+                 for printlang in linked_printlangs],
+                batch_size=self.context.batch_size)
+
+            self.context.update_counts['physical_cards_created'] += len(physical_card_groups)
+
+    def get_physical_card_groups(self, staged_cards, printings_by_json_id, printings_by_card_name, printlangs,
+                                 linked_printlang_ids):
+        """
+        Groups the printing languages of the staged cards into physical cards
+        :param staged_cards: The staged cards of a single set
+        :param printings_by_json_id: The printings in the set keyed by json_id
+        :param printings_by_card_name: The printings in the set keyed by card name
+        :param printlangs: The printing languages in the set keyed by printing id and language id
+        :param linked_printlang_ids: The ids of the printing languages that already belong to a physical card
+        :return: A list of (PhysicalCard, [CardPrintingLanguage]) tuples for the physical cards that should be created
+        """
+        physical_card_groups = []
+
+        for staged_card in staged_cards:
+            printing_obj = printings_by_json_id[staged_card.get_json_id()]
+
+            language_names = ['English']
+            if staged_card.has_foreign_names():
+                language_names += [card_language['language'] for card_language in staged_card.get_foreign_names()]
+
+            for language_name in language_names:
+                lang_obj = self.context.reference_cache.languages.get(language_name)
+                printlang_obj = self.find_printlang(printlangs, printing_obj, lang_obj.id)
+
+                if printlang_obj.id in linked_printlang_ids:
+                    logger.info(f'Physical link already exists for {printlang_obj}')
+                    self.context.update_counts['physical_cards_skipped'] += 1
+                    continue
 
-    def update_physical_card(self, printlang: CardPrintingLanguage, staged_card: StagedCard):
+                linked_printlangs = self.get_physical_card_printlangs(
+                    printlang_obj, printing_obj, staged_card, printings_by_card_name, printlangs)
 
-        if printlang.physical_cards.exists():
-            logger.info(f'Physical link already exists for {printlang}')
-            self.update_counts['physical_cards_skipped'] += 1
-            return
+                if linked_printlangs is None:
+                    continue
 
+                linked_printlang_ids.update(printlang.id for printlang in linked_printlangs)
+                physical_card_groups.append((PhysicalCard(layout=staged_card.get_layout()), linked_printlangs))
+
+        return physical_card_groups
+
+    def get_physical_card_printlangs(self, printlang: CardPrintingLanguage, printing: CardPrinting,
+                                     staged_card: StagedCard, printings_by_card_name, printlangs):
+        """
+        Finds all the printing languages that make up the same physical card as the given one
+        (e.g. both halves of a split card)
+        :param printlang: The printing language to find the physical card of
+        :param printing: The printing of that printing language
+        :param staged_card: The staged card of the printing
+        :param printings_by_card_name: The printings in the set keyed by card name
+        :param printlangs: The printing languages in the set keyed by printing id and language id
+        :return: The printing languages of the physical card,
+        or None if a physical card shouldn't be created for the given printing language
+        """
         if (staged_card.get_layout() == 'meld' and
                 staged_card.get_name_count() == 3 and
-                printlang.card_printing.collector_letter == 'b'):
+                printing.collector_letter == 'b'):
             logger.info(f'Will not create card link for meld card {printlang}')
-            return
+            return None
 
         logger.info(f'Updating physical cards for {printlang}')
 
-        linked_language_objs = []
+        linked_printlangs = []
 
         if staged_card.has_other_names():
 
             for link_name in staged_card.get_other_names():
 
-                link_card = Card.objects.get(name=link_name)
-                link_print = CardPrinting.objects.filter(
-                    card=link_card,
-                    set=printlang.card_printing.set).first()
+                link_print = printings_by_card_name.get(link_name)
                 if link_print is None:
-                    logger.error(f'Printing for link {link_card} in set {printlang.card_printing.set} not found')
+                    logger.error(f'Printing for link {link_name} in set {printing.set} not found')
                     raise LookupError()
 
                 if (staged_card.get_layout() == 'meld' and
-                        printlang.card_printing.collector_letter != 'b' and
+                        printing.collector_letter != 'b' and
                         link_print.collector_letter != 'b'):
                     logger.warning(
-                        f'Will not link {staged_card.get_name()} to {link_card} as they separate cards')
+                        f'Will not link {staged_card.get_name()} to {link_name} as they separate cards')
 
                     continue
 
-                link_print_lang = CardPrintingLanguage.objects.get(
-                    card_printing=link_print,
-                    language=printlang.language)
-
-                linked_language_objs.append(link_print_lang)
+                linked_printlangs.append(self.find_printlang(printlangs, link_print, printlang.language_id))
 
-        physical_card = PhysicalCard(layout=staged_card.get_layout())
-        physical_card.save()
-        self.update_counts['physical_cards_created'] += 1
+        linked_printlangs.append(printlang)
+        return linked_printlangs
 
-        linked_language_objs.append(printlang)
+    def find_printlang(self, printlangs, printing: CardPrinting, language_id):
+        printlang = printlangs.get((printing.id, language_id))
+        if printlang is None:
+            raise CardPrintingLanguage.DoesNotExist(
+                f'Printing language {language_id} for {printing} does not exist')
 
-        for link_lang in linked_language_objs:
-            link_lang.physical_cards.add(physical_card)
+        return printlang
 
     def update_card_links(self, staged_sets):
         for staged_set in staged_sets:
 
-            if staged_set.get_code() not in self.sets_to_update:
+            if staged_set.get_code() not in self.context.sets_to_update:
                 logger.info(f'Skipping set {staged_set.get_name()}')
                 continue
 
-            cards = staged_set.get_cards()
+            linked_cards = [x for x in staged_set.get_cards() if x.has_other_names()]
+            if not linked_cards:
+                continue
 
-            for staged_card in [x for x in cards if x.has_other_names()]:
-                card_obj = Card.objects.get(name=staged_card.get_name())
+            logger.info(f'Finding card links in {staged_set.get_name()}')
 
-                logger.info(f'Finding card links for {staged_card.get_name()}')
+            card_names = set()
+            for staged_card in linked_cards:
+                card_names.add(staged_card.get_name())
+                card_names.update(staged_card.get_other_names())
+
+            card_ids = dict(Card.objects.filter(name__in=card_names).values_list('name', 'id'))
+
+            existing_links = set(CardLink.objects.filter(from_card_id__in=card_ids.values())
+                                 .values_list('from_card_id', 'to_card_id'))
+
+            new_links = set()
+            for staged_card in linked_cards:
+                card_id = card_ids[staged_card.get_name()]
 
                 for link_name in staged_card.get_other_names():
-                    link_card = Card.objects.get(name=link_name)
+                    link_id = card_ids[link_name]
 
-                    card_obj.links.add(link_card)
-                    card_obj.save()
-                    self.update_counts['card_links_created'] += 1
+                    # Card links are symmetrical, so a row is needed in each direction
+                    for link in ((card_id, link_id), (link_id, card_id)):
+                        if link not in existing_links:
+                            new_links.add(link)
 
-    def update_legalities(self, staged_sets):
+            CardLink.objects.bulk_create(
+                [CardLink(from_card_id=from_card_id, to_card_id=to_card_id) for from_card_id, to_card_id in new_links],
+                batch_size=self.context.batch_size)
 
-        cards_updated = []
+            self.context.update_counts['card_links_created'] += len(new_links)
+
+    def update_legalities(self, staged_sets):
 
         for staged_set in staged_sets:
-            if staged_set.get_code() not in self.sets_to_update:
+            if staged_set.get_code() not in self.context.sets_to_update:
                 logger.info(f'Skipping set {staged_set.get_name()}')
                 continue
 
+            staged_cards = {}
             for staged_card in staged_set.get_cards():
+                if staged_card.get_name() not in self.context.legality_updated_cards and \
+                        self.context.is_first_printing(staged_card.get_name(), staged_set.get_code()):
+                    staged_cards.setdefault(staged_card.get_name(), staged_card)
 
-                if staged_card.get_name() in cards_updated:
-                    continue
+            if not staged_cards:
+                continue
+
+            logger.info(f'Updating legalities in {staged_set.get_name()}')
 
-                card_obj = Card.objects.get(name=staged_card.get_name())
+            self.context.legality_updated_cards.update(staged_cards.keys())
 
-                # Legalities can disappear form the json data if the card rolls out of standard,
-                # so all legalities should be cleared out and redone
-                card_obj.legalities.all().delete()
+            card_ids = dict(Card.objects.filter(name__in=staged_cards.keys()).values_list('name', 'id'))
 
+            # Legalities can disappear form the json data if the card rolls out of standard,
+            # so the legalities of each card are compared against the json data and any that are missing are removed
+            staged_legalities = set()
+            for card_name, staged_card in staged_cards.items():
                 for legality in staged_card.get_legalities():
-                    format_obj, created = Format.objects.get_or_create(name=legality['format'])
-                    legality, created = CardLegality.objects.get_or_create(card=card_obj, format=format_obj,
-                                                                           restriction=legality['legality'])
-                    self.update_counts['legalities_created' if created else 'legalities_updated'] += 1
+                    format_obj, created = self.context.reference_cache.formats.get_or_create(legality['format'])
+                    staged_legalities.add((card_ids[card_name], format_obj.id, legality['legality']))
+
+            existing_legalities = {
+                (card_id, format_id, restriction): legality_id
+                for legality_id, card_id, format_id, restriction in
+                CardLegality.objects.filter(card_id__in=card_ids.values())
+                    .values_list('id', 'card_id', 'format_id', 'restriction')}
+
+            legalities_to_delete = [legality_id for key, legality_id in existing_legalities.items()
+                                    if key not in staged_legalities]
+            legalities_to_create = [CardLegality(card_id=card_id, format_id=format_id, restriction=restriction)
+                                    for card_id, format_id, restriction in staged_legalities
+                                    if (card_id, format_id, restriction) not in existing_legalities]
 
-                cards_updated.append(staged_card.get_name())
+            CardLegality.objects.filter(id__in=legalities_to_delete).delete()
+            CardLegality.objects.bulk_create(legalities_to_create, batch_size=self.context.batch_size)
+
+            self.context.update_counts['legalities_deleted'] += len(legalities_to_delete)
+            self.context.update_counts['legalities_created'] += len(legalities_to_create)
+            self.context.update_counts['legalities_unchanged'] += \
+                len(staged_legalities) - len(legalities_to_create)
 
     def log_stats(self):
         logger.info('\n' + ('=' * 80) + '\n\nUpdate complete:\n')
-        elapsed_time = time.time() - self.start_time
+        elapsed_time = time.time() - self.context.start_time
         logger.info(f'Time elapsed: {time.strftime("%H:%M:%S", time.gmtime(elapsed_time))}')
-        for key, value in self.update_counts.items():
+        for key, value in self.context.update_counts.items():
             logger.info(f'{key}: {value}')
+
+        unchanged_count = self.context.update_counts['cards_unchanged'] + \
+                          self.context.update_counts['card_printings_unchanged']
+        logger.info(f'Unchanged rows skipped: {unchanged_count}')
+
+        logger.info('')
+        self.context.profiler.log_report(logger)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.4 on 2018-08-27 09:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(max_length=40)),
+                ('set_code', models.CharField(max_length=10)),
+                ('phase', models.CharField(max_length=50)),
+                ('set_selected', models.BooleanField(default=False)),
+                ('completed_date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='importcheckpoint',
+            unique_together=set([('source_hash', 'set_code', 'phase')]),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Records that a phase of update_database has been committed for a set, so an interrupted update can be resumed
+    """
+
+    # The SHA1 hash of the json file being imported, so checkpoints are only used for the same data
+    source_hash = models.CharField(max_length=40)
+    set_code = models.CharField(max_length=10)
+    phase = models.CharField(max_length=50)
+
+    # Whether the set was one of the sets to update when the phase was completed
+    set_selected = models.BooleanField(default=False)
+    completed_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source_hash', 'set_code', 'phase')
+
+    def __str__(self):
+        return f'{self.phase} completed for {self.set_code}'
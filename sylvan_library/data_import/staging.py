@@ -1,7 +1,9 @@
-import datetime, re
+import datetime, hashlib, json
 from functools import total_ordering
 
 from cards.models import Colour, Card
+from data_import._parsing import COLLECTOR_NUMBER_PATTERN, MCI_NUMBER_PATTERN, NUMERIC_STAT_PATTERN, COLOUR_TO_COUNT, \
+    parse_generic_mana
 
 COLOUR_NAME_TO_FLAG = {
     'white': Card.colour_flags.white,
@@ -62,8 +64,43 @@ COLOUR_TO_SORT_KEY = {
 }
 
 
+# The value_dict keys that the fields of a Card are derived from.
+# imageName is different for each printing, so the derived name is fingerprinted instead (see get_card_fingerprint)
+CARD_FINGERPRINT_KEYS = [
+    'manaCost', 'cmc', 'colors', 'colorIdentity',
+    'power', 'toughness', 'loyalty', 'supertypes', 'types', 'subtypes',
+    'text', 'layout', 'life', 'hand', 'reserved',
+]
+
+# The value_dict keys that the fields of a CardPrinting are derived from
+PRINTING_FINGERPRINT_KEYS = [
+    'id', 'number', 'artist', 'rarity', 'timeshifted', 'flavor', 'originalText', 'originalType',
+    'mciNumber', 'watermark', 'border', 'releaseDate', 'starter',
+]
+
+# Increment this whenever the way that fields are derived from the json data changes,
+# so that every card is updated the next time the database is updated
+FINGERPRINT_VERSION = 2
+
+
+def get_card_name(value_dict):
+    """
+    Gets the name of a card from its json data, which can be read without staging the card
+    """
+    if value_dict.get('name') == 'B.F.M. (Big Furry Monster)':
+        if value_dict['imageName'] == "b.f.m. 1":
+            return 'B.F.M. (Big Furry Monster) (left)'
+        elif value_dict['imageName'] == "b.f.m. 2":
+            return 'B.F.M. (Big Furry Monster) (right)'
+
+    return value_dict.get('name')
+
+
 @total_ordering
 class StagedCard:
+    __slots__ = ('value_dict', 'collector_number', 'collector_letter', 'name', 'colour', 'colour_identity',
+                 'colour_weight', 'num_power', 'num_toughness', 'num_loyalty', 'mci_number')
+
     def __init__(self, value_dict):
         self.value_dict = value_dict
 
@@ -71,13 +108,21 @@ class StagedCard:
         self.collector_letter = None
         self._parse_number()
 
+        # Derived fields are computed once up front, as they are read many times during an update
+        self.name = self._parse_name()
+        self.colour = self._parse_colour()
+        self.colour_identity = self._parse_colour_identity()
+        self.colour_weight = self._parse_colour_weight()
+        self.num_power = self.pow_tuff_to_num(value_dict['power']) if 'power' in value_dict else 0
+        self.num_toughness = self.pow_tuff_to_num(value_dict['toughness']) if 'toughness' in value_dict else 0
+        self.num_loyalty = self.pow_tuff_to_num(value_dict['loyalty']) if 'loyalty' in value_dict else 0
+        self.mci_number = self._parse_mci_number()
+
     def _parse_number(self):
         if 'number' not in self.value_dict:
             return
 
-        match = re.search(
-            '^(?P<special>[\D]+)?(?P<number>[\d]+)(?P<letter>[\D]+)?$',
-            self.value_dict['number'])
+        match = COLLECTOR_NUMBER_PATTERN.match(self.value_dict['number'])
 
         self.collector_number = int(match.group('number'))
         self.collector_letter = (
@@ -92,36 +137,23 @@ class StagedCard:
                self.get_name() == other.get_name()
 
     def __lt__(self, other: 'StagedCard'):
+        return self.get_sort_key() < other.get_sort_key()
 
-        # Push cards without a collector number to the end of the set
-        if self.get_collector_number() is not None and other.get_collector_number() is None:
-            return True
-
-        if self.get_collector_number() is None and other.get_collector_number() is not None:
-            return False
+    def get_sort_key(self):
+        """
+        Gets a key that orders cards by collector number, then by collector letter (cards without a letter last),
+        then by name. Cards without a collector number are pushed to the end of the set, after the '★' cards
+        """
+        if self.collector_number is None:
+            return 1, self.name
 
-        if self.get_collector_number() is not None and other.get_collector_number() is not None:
+        if self.collector_letter == '★':
+            return 0, 1
 
-            # Push '★" cards to the end of the set
-            if self.get_collector_letter() == '★':
-                return False
+        if self.collector_letter is None:
+            return 0, 0, self.collector_number, 1, self.name
 
-            if other.get_collector_letter() == '★':
-                return True
-
-            if self.get_collector_number() != other.get_collector_number():
-                return self.get_collector_number() < other.get_collector_number()
-
-            if self.get_collector_letter() is not None and other.get_collector_letter() is None:
-                return True
-
-            if self.get_collector_letter() is None and other.get_collector_letter() is not None:
-                return False
-
-            if self.get_collector_letter() is not None and other.get_collector_letter() is not None:
-                return self.get_collector_letter() < other.get_collector_letter()
-
-        return self.get_name() < other.get_name()
+        return 0, 0, self.collector_number, 0, self.collector_letter
 
     def get_multiverse_id(self):
         return self.value_dict.get('multiverseid')
@@ -133,13 +165,10 @@ class StagedCard:
         return self.value_dict['foreignNames']
 
     def get_name(self):
-        if self.value_dict['name'] == 'B.F.M. (Big Furry Monster)':
-            if self.value_dict['imageName'] == "b.f.m. 1":
-                return 'B.F.M. (Big Furry Monster) (left)'
-            elif self.value_dict['imageName'] == "b.f.m. 2":
-                return 'B.F.M. (Big Furry Monster) (right)'
+        return self.name
 
-        return self.value_dict['name']
+    def _parse_name(self):
+        return get_card_name(self.value_dict)
 
     def get_mana_cost(self):
         return self.value_dict.get('manaCost')
@@ -148,6 +177,9 @@ class StagedCard:
         return self.value_dict.get('cmc') or 0
 
     def get_colour(self):
+        return self.colour
+
+    def _parse_colour(self):
         result = 0
         if 'colors' in self.value_dict:
             for colour_name in self.value_dict['colors']:
@@ -159,16 +191,18 @@ class StagedCard:
         return COLOUR_TO_SORT_KEY[int(self.get_colour())]
 
     def get_colour_weight(self):
+        return self.colour_weight
+
+    def _parse_colour_weight(self):
         if not self.get_mana_cost():
             return 0
 
-        generic_mana = re.search('(\d+)', self.get_mana_cost())
-        if not generic_mana:
-            return self.get_cmc()
-        else:
-            return self.get_cmc() - int(generic_mana.group(0))
+        return self.get_cmc() - parse_generic_mana(self.get_mana_cost())
 
     def get_colour_identity(self):
+        return self.colour_identity
+
+    def _parse_colour_identity(self):
         result = 0
         if 'colorIdentity' in self.value_dict:
             for colour_code in self.value_dict['colorIdentity']:
@@ -177,7 +211,7 @@ class StagedCard:
         return result
 
     def get_colour_count(self):
-        return bin(self.get_colour()).count('1')
+        return COLOUR_TO_COUNT[int(self.get_colour())]
 
     def get_power(self):
         return self.value_dict.get('power')
@@ -186,25 +220,16 @@ class StagedCard:
         return self.value_dict.get('toughness')
 
     def get_num_power(self):
-        if 'power' in self.value_dict:
-            return self.pow_tuff_to_num(self.value_dict['power'])
-        else:
-            return 0
+        return self.num_power
 
     def get_num_toughness(self):
-        if 'toughness' in self.value_dict:
-            return self.pow_tuff_to_num(self.value_dict['toughness'])
-        else:
-            return 0
+        return self.num_toughness
 
     def get_loyalty(self):
         return self.value_dict.get('loyalty')
 
     def get_num_loyalty(self):
-        if 'loyalty' in self.value_dict:
-            return self.pow_tuff_to_num(self.value_dict['loyalty'])
-        else:
-            return 0
+        return self.num_loyalty
 
     def get_types(self):
         if 'types' in self.value_dict:
@@ -253,16 +278,37 @@ class StagedCard:
     def get_rulings(self):
         return self.value_dict['rulings']
 
+    def get_rulings_hash(self):
+        if not self.has_rulings() or not self.get_rulings():
+            return None
+
+        rulings = sorted((ruling['date'], ruling['text']) for ruling in self.get_rulings())
+        return hashlib.sha1(json.dumps(rulings).encode('utf8')).hexdigest()
+
     def get_json_id(self):
         return self.value_dict['id']
 
+    def get_card_fingerprint(self):
+        # The name is the only card field that uses imageName (to tell the halves of B.F.M. apart)
+        return self._get_fingerprint(CARD_FINGERPRINT_KEYS, [self.get_name()])
+
+    def get_printing_fingerprint(self):
+        # The collector number is included as it can be set after the card is staged
+        return self._get_fingerprint(PRINTING_FINGERPRINT_KEYS,
+                                     [self.get_collector_number(), self.get_collector_letter()])
+
+    def _get_fingerprint(self, keys, extra_values=None):
+        values = [FINGERPRINT_VERSION, [self.value_dict.get(key) for key in keys], extra_values]
+        return hashlib.sha1(json.dumps(values, sort_keys=True).encode('utf8')).hexdigest()
+
     def get_mci_number(self):
+        return self.mci_number
+
+    def _parse_mci_number(self):
         if 'mciNumber' not in self.value_dict:
             return None
 
-        mci_match = re.search(
-            '^(/(?P<set>[^/]*)/(?P<lang>[^/]*)/)?(?P<num>[0-9]+)(\.html)?$',
-            self.value_dict['mciNumber'])
+        mci_match = MCI_NUMBER_PATTERN.match(self.value_dict['mciNumber'])
 
         if mci_match:
             return mci_match.group('num')
@@ -339,7 +385,7 @@ class StagedCard:
         return self.value_dict['name']
 
     def pow_tuff_to_num(self, val):
-        match = re.search('(-?[\d.]+)', str(val))
+        match = NUMERIC_STAT_PATTERN.search(str(val))
         if match:
             return match.group()
 
@@ -347,9 +393,12 @@ class StagedCard:
 
 
 class StagedSet:
+    __slots__ = ('value_dict', 'staged_cards', 'sorted_cards')
+
     def __init__(self, value_dict):
         self.value_dict = value_dict
         self.staged_cards = list()
+        self.sorted_cards = None
 
         for card in self.value_dict['cards']:
             self.add_card(card)
@@ -362,9 +411,17 @@ class StagedSet:
             return
 
         self.staged_cards.append(staged_card)
+        self.sorted_cards = None
 
     def get_cards(self):
-        return sorted(self.staged_cards)
+        """
+        Gets the cards in the set in collector number order.
+        The cards are only sorted the first time this is called, so the result shouldn't be modified
+        """
+        if self.sorted_cards is None:
+            self.sorted_cards = sorted(self.staged_cards, key=StagedCard.get_sort_key)
+
+        return self.sorted_cards
 
     def get_code(self):
         return self.value_dict['code']
@@ -1,5 +1,34 @@
-from django.test import TestCase
+import io, json, os, tempfile, threading, time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from pytz import utc
+
+from cards.models import *
+from data_import.management.commands.update_database import Command as UpdateDatabaseCommand
+from data_import.management.commands.update_database import CardLink, FRESH_MODELS, SET_PHASES
 from data_import.staging import *
+from data_import import _paths
+from data_import._backup import BackupResult, get_pg_dump_args
+from data_import._bulk import bulk_update
+from data_import._copy import CopyBuffer
+from data_import._download import download_file, load_metadata
+from data_import._image_download import ImageDownloader, TokenBucket
+from data_import._import_context import ImportContext
+from data_import._json_stream import JsonStreamReader
+from data_import._locks import acquire_locks, get_lock_id, get_set_lock_keys
+from data_import._parsing import parse_generic_mana
+from data_import._profiling import ImportProfiler
+from data_import._reference_cache import ModelCache
+from data_import._snapshot import SnapshotWriter, is_snapshot_valid, iter_snapshot
+from data_import._user_cards import PhysicalCardLink, get_physical_card_map
+from data_import.models import ImportCheckpoint
+from cards.tests import create_test_card, create_test_rarity, create_test_set
 
 
 class StagedCardTestCase(TestCase):
@@ -26,3 +55,910 @@ class StagedCardTestCase(TestCase):
     def test_colour_weight_none(self):
         staged_card = StagedCard({})
         self.assertEquals(0, staged_card.get_colour_weight())
+
+    def test_rulings_hash(self):
+        rulings = [{'date': '2004-10-04', 'text': 'Foo'}, {'date': '2008-08-01', 'text': 'Bar'}]
+        staged_card = StagedCard({'rulings': rulings})
+        reordered_card = StagedCard({'rulings': list(reversed(rulings))})
+        self.assertEqual(staged_card.get_rulings_hash(), reordered_card.get_rulings_hash())
+
+        changed_card = StagedCard({'rulings': rulings[:1]})
+        self.assertNotEqual(staged_card.get_rulings_hash(), changed_card.get_rulings_hash())
+
+    def test_rulings_hash_none(self):
+        self.assertIsNone(StagedCard({}).get_rulings_hash())
+        self.assertIsNone(StagedCard({'rulings': []}).get_rulings_hash())
+
+    def test_card_fingerprint(self):
+        staged_card = StagedCard({'name': 'Forest', 'types': ['Land'], 'artist': 'John Avon'})
+        reprint = StagedCard({'name': 'Forest', 'types': ['Land'], 'artist': 'Rob Alexander'})
+        self.assertEqual(staged_card.get_card_fingerprint(), reprint.get_card_fingerprint())
+        self.assertNotEqual(staged_card.get_printing_fingerprint(), reprint.get_printing_fingerprint())
+
+    def test_card_fingerprint_image_name(self):
+        staged_card = StagedCard({'name': 'Forest', 'imageName': 'forest1'})
+        reprint = StagedCard({'name': 'Forest', 'imageName': 'forest2'})
+        self.assertEqual(staged_card.get_card_fingerprint(), reprint.get_card_fingerprint())
+
+        left = StagedCard({'name': 'B.F.M. (Big Furry Monster)', 'imageName': 'b.f.m. 1'})
+        right = StagedCard({'name': 'B.F.M. (Big Furry Monster)', 'imageName': 'b.f.m. 2'})
+        self.assertNotEqual(left.get_card_fingerprint(), right.get_card_fingerprint())
+
+    def test_printing_fingerprint_collector_number(self):
+        staged_card = StagedCard({'name': 'Forest'})
+        fingerprint = staged_card.get_printing_fingerprint()
+        staged_card.set_collector_number(5)
+        self.assertNotEqual(fingerprint, staged_card.get_printing_fingerprint())
+
+
+class StagedSetTestCase(TestCase):
+    def test_get_cards_order(self):
+        staged_set = StagedSet({'cards': [
+            {'name': 'Unnumbered'},
+            {'name': 'Star', 'number': '1★'},
+            {'name': 'Two', 'number': '2'},
+            {'name': 'One B', 'number': '1b'},
+            {'name': 'One', 'number': '1'},
+            {'name': 'One A', 'number': '1a'},
+        ]})
+
+        self.assertEqual(['One A', 'One B', 'One', 'Two', 'Star', 'Unnumbered'],
+                         [staged_card.get_name() for staged_card in staged_set.get_cards()])
+
+
+class ParseGenericManaTestCase(TestCase):
+    def test_generic_and_coloured(self):
+        self.assertEqual(1, parse_generic_mana('{1}{G}{G}'))
+
+    def test_large_generic(self):
+        self.assertEqual(1000000, parse_generic_mana('{1000000}'))
+
+    def test_variable(self):
+        self.assertEqual(0, parse_generic_mana('{X}{R}{R}'))
+
+    def test_monocoloured_hybrid(self):
+        self.assertEqual(2, parse_generic_mana('{2/R}{2/R}{2/R}'))
+
+    def test_half_mana(self):
+        self.assertEqual(0, parse_generic_mana('{hw}'))
+
+
+class JsonStreamReaderTestCase(TestCase):
+    def test_iter_items(self):
+        data = {'LEA': {'name': 'Limited Edition Alpha', 'cards': []},
+                'JOU': {'name': 'Journey into Nyx', 'cards': [{'name': 'Jötun Grunt'}]}}
+        raw = json.dumps(data, indent=2).encode('utf8')
+
+        items = list(JsonStreamReader(io.BytesIO(raw), chunk_size=8).iter_items())
+
+        self.assertEqual(['LEA', 'JOU'], [key for key, _, _, _ in items])
+        for key, value, offset, length in items:
+            self.assertEqual(data[key], value)
+            self.assertEqual(value, json.loads(raw[offset:offset + length].decode('utf8')))
+
+    def test_empty_object(self):
+        self.assertEqual([], list(JsonStreamReader(io.BytesIO(b' {} ')).iter_items()))
+
+
+class BulkUpdateTestCase(TestCase):
+    def test_bulk_update(self):
+        foo = create_test_card({'name': 'foo'})
+        bar = create_test_card({'name': 'bar', 'rules_text': 'Flying'})
+
+        foo.rules_text = 'Trample'
+        foo.cmc = 2.5
+        bar.rules_text = None
+
+        self.assertEqual(2, bulk_update(Card, [foo, bar], ['rules_text', 'cmc'], batch_size=1))
+
+        self.assertEqual('Trample', Card.objects.get(name='foo').rules_text)
+        self.assertEqual(2.5, Card.objects.get(name='foo').cmc)
+        self.assertIsNone(Card.objects.get(name='bar').rules_text)
+
+    def test_bulk_update_empty(self):
+        self.assertEqual(0, bulk_update(Card, [], ['rules_text']))
+
+
+class ImportContextTestCase(TestCase):
+    def test_in_order(self):
+        context = ImportContext()
+
+        self.assertTrue(context.should_update_card('Forest', 'LEA'))
+        self.assertTrue(context.is_first_printing('Forest', 'LEB'))
+
+    def test_out_of_order(self):
+        context = ImportContext()
+        context.card_update_sets = {'Forest': 'LEB'}
+        context.card_first_sets = {'Forest': 'LEA'}
+
+        self.assertTrue(context.should_update_card('Forest', 'LEB'))
+        self.assertFalse(context.should_update_card('Forest', 'LEA'))
+        self.assertTrue(context.is_first_printing('Forest', 'LEA'))
+        self.assertFalse(context.is_first_printing('Forest', 'LEB'))
+
+
+class CopyBufferTestCase(TestCase):
+    def test_format_value(self):
+        self.assertEqual('', CopyBuffer.format_value(None))
+        self.assertEqual('""', CopyBuffer.format_value(''))
+        self.assertEqual('"Deals 3 damage to ""any"" target,\nfoo"',
+                         CopyBuffer.format_value('Deals 3 damage to "any" target,\nfoo'))
+        self.assertEqual('"False"', CopyBuffer.format_value(False))
+
+
+class ModelCacheTestCase(TestCase):
+    def test_get_or_create(self):
+        cache = ModelCache(Format, 'name')
+        cache.load()
+
+        format_obj, created = cache.get_or_create('Vintage')
+        self.assertTrue(created)
+        self.assertTrue(Format.objects.filter(name='Vintage').exists())
+
+        self.assertEqual((format_obj, False), cache.get_or_create('Vintage'))
+        self.assertIs(format_obj, cache.get('Vintage'))
+
+    def test_get_missing(self):
+        cache = ModelCache(Format, 'name')
+        cache.load()
+        self.assertIsNone(cache.find('Legacy'))
+        self.assertRaises(Format.DoesNotExist, cache.get, 'Legacy')
+
+
+def get_test_json_sets():
+    """
+    Gets the json data of two small sets, where the second set reprints a card from the first with different text
+    """
+    return {
+        'LEA': {
+            'code': 'LEA', 'name': 'Limited Edition Alpha', 'releaseDate': '1993-08-05', 'border': 'black',
+            'cards': [
+                {'id': 'lea-forest', 'name': 'Forest', 'number': '1', 'artist': 'Christopher Rush',
+                 'rarity': 'Basic Land', 'layout': 'normal', 'supertypes': ['Basic'], 'types': ['Land'],
+                 'subtypes': ['Forest'], 'multiverseid': 288,
+                 'foreignNames': [{'language': 'French', 'name': 'Forêt', 'multiverseid': 1288}],
+                 'legalities': [{'format': 'Vintage', 'legality': 'Legal'}]},
+                {'id': 'lea-bolt', 'name': 'Lightning Bolt', 'number': '2', 'artist': 'Christopher Rush',
+                 'rarity': 'Common', 'layout': 'normal', 'manaCost': '{R}', 'cmc': 1, 'colors': ['Red'],
+                 'colorIdentity': ['R'], 'types': ['Instant'], 'multiverseid': 209,
+                 'text': 'Lightning Bolt deals 3 damage to "any" target.',
+                 'rulings': [{'date': '2004-10-04', 'text': 'It can target a player, or a creature.'}],
+                 'legalities': [{'format': 'Vintage', 'legality': 'Restricted'}]},
+            ],
+        },
+        'LEB': {
+            'code': 'LEB', 'name': 'Limited Edition Beta', 'releaseDate': '1993-10-04', 'border': 'black',
+            'cards': [
+                {'id': 'leb-bolt', 'name': 'Lightning Bolt', 'number': '1', 'artist': 'Christopher Rush',
+                 'rarity': 'Common', 'layout': 'normal', 'manaCost': '{R}', 'cmc': 1, 'colors': ['Red'],
+                 'colorIdentity': ['R'], 'types': ['Instant'], 'multiverseid': 509,
+                 'text': 'Lightning Bolt deals 3 damage to target creature or player.',
+                 'rulings': [{'date': '2010-06-15', 'text': 'A different ruling.'}],
+                 'legalities': [{'format': 'Legacy', 'legality': 'Legal'}]},
+                {'id': 'leb-shivan', 'name': 'Shivan Dragon', 'number': '2', 'artist': 'Melissa A. Benson',
+                 'rarity': 'Rare', 'layout': 'normal', 'manaCost': '{4}{R}{R}', 'cmc': 6, 'colors': ['Red'],
+                 'colorIdentity': ['R'], 'types': ['Creature'], 'subtypes': ['Dragon'], 'power': '5',
+                 'toughness': '5', 'reserved': True, 'releaseDate': '1993-10-04',
+                 'text': 'Flying\n{R}: Shivan Dragon gets +1/+0 until end of turn.',
+                 'flavor': 'While it\'s true most dragons are cruel, the Shivan Dragon seems to take "pleasure" in it.',
+                 'legalities': [{'format': 'Vintage', 'legality': 'Legal'}]},
+                {'id': 'leb-fire', 'name': 'Fire', 'names': ['Fire', 'Ice'], 'number': '3a', 'artist': 'Dan Scott',
+                 'rarity': 'Uncommon', 'layout': 'split', 'manaCost': '{1}{R}', 'cmc': 2, 'colors': ['Red'],
+                 'colorIdentity': ['R', 'U'], 'types': ['Instant'],
+                 'text': 'Fire deals 2 damage divided as you choose.'},
+                {'id': 'leb-ice', 'name': 'Ice', 'names': ['Fire', 'Ice'], 'number': '3b', 'artist': 'Dan Scott',
+                 'rarity': 'Uncommon', 'layout': 'split', 'manaCost': '{1}{U}', 'cmc': 2, 'colors': ['Blue'],
+                 'colorIdentity': ['R', 'U'], 'types': ['Instant'], 'text': 'Tap target permanent.'},
+            ],
+        },
+    }
+
+
+def get_imported_rows():
+    """
+    Gets every row that update_database writes, with the rows that each row refers to identified by name
+    instead of by id, so the results of separate imports can be compared
+    """
+    card_fields = [field.attname for field in Card._meta.concrete_fields if not field.primary_key]
+    printing_fields = [field.attname for field in CardPrinting._meta.concrete_fields
+                       if field.attname not in ('id', 'card_id', 'set_id')]
+
+    physical_cards = {}
+    for physical_card_id, layout, json_id, language_name in PhysicalCardLink.objects.values_list(
+            'physicalcard_id', 'physicalcard__layout',
+            'cardprintinglanguage__card_printing__json_id', 'cardprintinglanguage__language__name'):
+        physical_cards.setdefault(physical_card_id, (layout, []))[1].append((json_id, language_name))
+
+    return {
+        'cards': sorted(Card.objects.values_list('name', *card_fields)),
+        'card_links': sorted(CardLink.objects.values_list('from_card__name', 'to_card__name')),
+        'printings': sorted(CardPrinting.objects.values_list('json_id', 'card__name', 'set__code',
+                                                             *printing_fields)),
+        'printing_languages': sorted(CardPrintingLanguage.objects.values_list(
+            'card_printing__json_id', 'language__name', 'card_name', 'multiverse_id')),
+        'physical_cards': sorted((layout, sorted(links)) for layout, links in physical_cards.values()),
+        'physical_card_count': PhysicalCard.objects.count(),
+        'rulings': sorted(CardRuling.objects.values_list('card__name', 'date', 'text')),
+        'legalities': sorted(CardLegality.objects.values_list('card__name', 'format__name', 'restriction')),
+    }
+
+
+class UpdateDatabaseTestMixin:
+    """
+    Runs update_database on the json data of get_test_json_sets
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+        for path_name in ('json_data_path', 'snapshot_path'):
+            patcher = mock.patch.object(_paths, path_name, os.path.join(self.temp_dir.name, path_name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.json_sets = get_test_json_sets()
+
+    def run_update(self, **options):
+        """
+        Writes the json sets to the json data file and runs update_database on them
+        :return: The command that was run, so its update counts can be checked
+        """
+        with open(_paths.json_data_path, 'w', encoding='utf8') as f:
+            json.dump(self.json_sets, f)
+
+        command = UpdateDatabaseCommand()
+        call_command(command, **options)
+        return command
+
+    def fail_phase(self, phase, set_code):
+        """
+        Patches a set phase of update_database to raise an error when it is run for the given set
+        """
+        original_phase = getattr(UpdateDatabaseCommand, phase)
+
+        def run_phase(command, staged_sets):
+            if staged_sets[0].get_code() == set_code:
+                raise RuntimeError(f'{phase} failed for {set_code}')
+
+            return original_phase(command, staged_sets)
+
+        return mock.patch.object(UpdateDatabaseCommand, phase, run_phase)
+
+    def record_phases(self, phase_calls):
+        """
+        Patches update_database to add the (set code, phase) of every set phase that is run to the given list
+        """
+        original_run_set_phase = UpdateDatabaseCommand.run_set_phase
+
+        def run_set_phase(command, phase, staged_set):
+            phase_calls.append((staged_set.get_code(), phase))
+            return original_run_set_phase(command, phase, staged_set)
+
+        return mock.patch.object(UpdateDatabaseCommand, 'run_set_phase', run_set_phase)
+
+
+class UpdateDatabaseTestCase(UpdateDatabaseTestMixin, TestCase):
+    def test_import(self):
+        self.run_update()
+
+        self.assertEqual({'Forest', 'Lightning Bolt', 'Shivan Dragon', 'Fire', 'Ice'},
+                         set(Card.objects.values_list('name', flat=True)))
+        self.assertEqual({'lea-forest', 'lea-bolt', 'leb-bolt', 'leb-shivan', 'leb-fire', 'leb-ice'},
+                         set(CardPrinting.objects.values_list('json_id', flat=True)))
+        self.assertEqual(7, CardPrintingLanguage.objects.count())
+
+        shivan = Card.objects.get(name='Shivan Dragon')
+        self.assertEqual('Flying\n{R}: Shivan Dragon gets +1/+0 until end of turn.', shivan.rules_text)
+        self.assertEqual(2, shivan.colour_weight)
+        self.assertTrue(shivan.is_reserved)
+
+        # The two halves of the split card are linked, and share a single physical card
+        self.assertEqual(['Ice'], list(Card.objects.get(name='Fire').links.values_list('name', flat=True)))
+        self.assertEqual(6, PhysicalCard.objects.count())
+        self.assertEqual(1, PhysicalCard.objects.filter(printed_languages__card_name='Fire')
+                         .filter(printed_languages__card_name='Ice').count())
+
+    def test_reprint_ignored(self):
+        command = self.run_update()
+
+        bolt = Card.objects.get(name='Lightning Bolt')
+        self.assertEqual('Lightning Bolt deals 3 damage to "any" target.', bolt.rules_text)
+        self.assertEqual(['LEA', 'LEB'], sorted(bolt.printings.values_list('set__code', flat=True)))
+        self.assertEqual(1, command.context.update_counts['cards_ignored'])
+
+        # Rulings and legalities also come from the first printing
+        self.assertEqual(['It can target a player, or a creature.'],
+                         list(bolt.rulings.values_list('text', flat=True)))
+        self.assertEqual([('Vintage', 'Restricted')],
+                         list(bolt.legalities.values_list('format__name', 'restriction')))
+
+    def test_unchanged_fingerprint_skips_write(self):
+        self.run_update()
+
+        # Unchanged cards and printings aren't written, so changes that didn't come from the json data are kept
+        Card.objects.filter(name='Forest').update(type='Changed')
+        CardPrinting.objects.filter(json_id='lea-forest').update(artist='Changed')
+
+        command = self.run_update(force_update_sets=['LEA'])
+
+        self.assertEqual('Changed', Card.objects.get(name='Forest').type)
+        self.assertEqual('Changed', CardPrinting.objects.get(json_id='lea-forest').artist)
+        self.assertEqual(2, command.context.update_counts['cards_unchanged'])
+        self.assertEqual(2, command.context.update_counts['card_printings_unchanged'])
+        self.assertEqual(0, command.context.update_counts['cards_updated'])
+        self.assertEqual(0, command.context.update_counts['card_printings_updated'])
+
+    def test_changed_fields_updated(self):
+        self.run_update()
+        card_id = Card.objects.get(name='Lightning Bolt').id
+
+        self.json_sets['LEA']['cards'][1]['text'] = 'Lightning Bolt deals 3 damage to any target.'
+        self.json_sets['LEA']['cards'][1]['artist'] = 'Christopher Moeller'
+        command = self.run_update(force_update_sets=['LEA'])
+
+        bolt = Card.objects.get(name='Lightning Bolt')
+        self.assertEqual(card_id, bolt.id)
+        self.assertEqual('Lightning Bolt deals 3 damage to any target.', bolt.rules_text)
+        self.assertEqual('Christopher Moeller', CardPrinting.objects.get(json_id='lea-bolt').artist)
+        self.assertEqual('Christopher Rush', CardPrinting.objects.get(json_id='leb-bolt').artist)
+
+        self.assertEqual(1, command.context.update_counts['cards_updated'])
+        self.assertEqual(1, command.context.update_counts['cards_unchanged'])
+        self.assertEqual(1, command.context.update_counts['card_printings_updated'])
+        self.assertEqual(0, command.context.update_counts['cards_created'])
+
+    def test_second_update_unchanged(self):
+        self.run_update()
+        rows = get_imported_rows()
+        card_ids = list(Card.objects.order_by('id').values_list('id', flat=True))
+        printing_ids = list(CardPrinting.objects.order_by('id').values_list('id', flat=True))
+
+        command = self.run_update(force_update_sets=['LEA', 'LEB'])
+
+        self.assertEqual(rows, get_imported_rows())
+        self.assertEqual(card_ids, list(Card.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(printing_ids, list(CardPrinting.objects.order_by('id').values_list('id', flat=True)))
+
+        for key in ('cards_created', 'cards_updated', 'card_printings_created', 'card_printings_updated',
+                    'printing_languages_created', 'physical_cards_created', 'card_links_created',
+                    'rulings_created', 'rulings_deleted', 'legalities_created', 'legalities_deleted'):
+            self.assertEqual(0, command.context.update_counts[key], key)
+
+    def test_fresh(self):
+        self.run_update()
+        rows = get_imported_rows()
+
+        PhysicalCard.objects.all().delete()
+        Card.objects.all().delete()
+
+        # Start every id sequence from 1 again, so a sequence that isn't moved past the copied rows would clash
+        with connection.cursor() as cursor:
+            for model in FRESH_MODELS:
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('\"{model._meta.db_table}\"', 'id'), "
+                               f"1, false)")
+
+        command = self.run_update(fresh=True)
+
+        self.assertEqual(rows, get_imported_rows())
+        self.assertEqual(5, command.context.update_counts['cards_created'])
+
+        max_card_id = Card.objects.order_by('-id').first().id
+        self.assertEqual(max_card_id + 1, create_test_card({'name': 'Black Lotus'}).id)
+
+        with connection.cursor() as cursor:
+            for model in FRESH_MODELS:
+                table_name = model._meta.db_table
+                cursor.execute(f"SELECT nextval(pg_get_serial_sequence('\"{table_name}\"', 'id')), "
+                               f"(SELECT max(id) FROM \"{table_name}\")")
+                next_id, max_id = cursor.fetchone()
+                self.assertEqual(max_id + 1, next_id, table_name)
+
+    def test_fresh_existing_cards(self):
+        self.run_update()
+
+        self.assertRaises(CommandError, self.run_update, fresh=True)
+
+    def test_resume(self):
+        with self.fail_phase('update_physical_card_list', 'LEB'):
+            self.assertRaises(RuntimeError, self.run_update, checkpoint=True)
+
+        self.assertEqual(SET_PHASES + SET_PHASES[:4], list(
+            ImportCheckpoint.objects.order_by('id').values_list('phase', flat=True)))
+        self.assertEqual(0, PhysicalCard.objects.filter(printed_languages__card_printing__set__code='LEB').count())
+
+        phase_calls = []
+        with self.record_phases(phase_calls):
+            self.run_update(resume=True)
+
+        # Only the phases after the failure are run, and they still update the set that was new before it failed
+        self.assertEqual([('LEB', phase) for phase in SET_PHASES[4:]], phase_calls)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        resumed_rows = get_imported_rows()
+
+        PhysicalCard.objects.all().delete()
+        Card.objects.all().delete()
+        Set.objects.all().delete()
+        self.run_update()
+
+        self.assertEqual(get_imported_rows(), resumed_rows)
+
+    def test_resume_unselected_set(self):
+        self.run_update()
+
+        # Neither set is updated without --update-all, so the changed card is ignored
+        self.json_sets['LEA']['cards'][1]['text'] = 'Lightning Bolt deals 3 damage to any target.'
+        with self.fail_phase('update_card_list', 'LEA'):
+            self.assertRaises(RuntimeError, self.run_update, checkpoint=True)
+
+        phase_calls = []
+        with self.record_phases(phase_calls):
+            self.run_update(resume=True)
+
+        self.assertEqual([('LEA', phase) for phase in SET_PHASES[2:]] + [('LEB', phase) for phase in SET_PHASES],
+                         phase_calls)
+        self.assertEqual('Lightning Bolt deals 3 damage to "any" target.',
+                         Card.objects.get(name='Lightning Bolt').rules_text)
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_workers_incompatible_options(self):
+        for options in ({'fresh': True}, {'checkpoint': True}, {'resume': True}, {'staging_workers': 2},
+                        {'profile_dir': self.temp_dir.name}):
+            self.assertRaises(CommandError, self.run_update, workers=2, **options)
+
+
+class UpdateDatabaseWorkersTestCase(UpdateDatabaseTestMixin, TransactionTestCase):
+    """
+    The workers of update_database --workers use their own connections, so the rows they write have to be committed
+    """
+
+    def test_workers(self):
+        self.run_update()
+        rows = get_imported_rows()
+
+        PhysicalCard.objects.all().delete()
+        Card.objects.all().delete()
+        Set.objects.all().delete()
+
+        command = self.run_update(workers=2)
+
+        # The reprint is imported at the same time as the first printing, but the card still comes from the first
+        self.assertEqual(rows, get_imported_rows())
+        self.assertEqual(5, command.context.update_counts['cards_created'])
+        self.assertEqual(6, command.context.update_counts['card_printings_created'])
+
+    def test_workers_update_all(self):
+        self.run_update()
+
+        self.json_sets['LEB']['cards'][1]['text'] = 'Flying'
+        self.run_update(workers=2, force_update=True)
+
+        # A force update rewrites each card from its last printing, as it does when the sets are imported in order
+        self.assertEqual('Lightning Bolt deals 3 damage to target creature or player.',
+                         Card.objects.get(name='Lightning Bolt').rules_text)
+        self.assertEqual('Flying', Card.objects.get(name='Shivan Dragon').rules_text)
+
+
+class LocksTestCase(TestCase):
+    def test_get_set_lock_keys(self):
+        staged_set = StagedSet({'block': 'Kamigawa', 'cards': [
+            {'name': 'Bushi Tenderfoot', 'number': '2a', 'names': ['Bushi Tenderfoot', 'Kenzo the Hardhearted'],
+             'legalities': [{'format': 'Legacy', 'legality': 'Legal'}]},
+        ]})
+
+        self.assertEqual({'block:Kamigawa', 'card:Bushi Tenderfoot', 'card:Kenzo the Hardhearted', 'format:Legacy'},
+                         get_set_lock_keys(staged_set))
+
+    def test_get_lock_id(self):
+        lock_id = get_lock_id('card:Forest')
+
+        self.assertEqual(lock_id, get_lock_id('card:Forest'))
+        self.assertNotEqual(lock_id, get_lock_id('card:Island'))
+        self.assertTrue(-2 ** 63 <= lock_id < 2 ** 63)
+
+    def test_acquire_locks(self):
+        with connection.cursor() as cursor:
+            acquire_locks(cursor, {'card:Forest', 'card:Island'})
+
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            self.assertEqual(2, cursor.fetchone()[0])
+
+
+class ImportProfilerTestCase(TestCase):
+    def test_phase_totals(self):
+        profiler = ImportProfiler()
+
+        for _ in range(2):
+            with profiler.phase('update_card_list'):
+                profiler.record_query(0.5)
+
+        with profiler.phase('update_legalities'):
+            pass
+
+        report = profiler.get_report()
+        self.assertEqual(['update_card_list', 'update_legalities'], list(report.keys()))
+        self.assertEqual(2, report['update_card_list']['calls'])
+        self.assertEqual(2, report['update_card_list']['query_count'])
+        self.assertEqual(1.0, report['update_card_list']['query_time'])
+        self.assertEqual(0, report['update_legalities']['query_count'])
+
+    def test_install(self):
+        profiler = ImportProfiler()
+        card = create_test_card({'name': 'foo'})
+
+        with profiler.install(connection), profiler.phase('query'):
+            Card.objects.get(id=card.id)
+
+        self.assertEqual(1, profiler.get_report()['query']['query_count'])
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.temp_dir.name, 'AllSets-x.snapshot')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        staged_set = StagedSet({'code': 'LEA', 'cards': [
+            {'name': 'Two', 'number': '2', 'manaCost': '{2}{W}', 'cmc': 3},
+            {'name': 'One', 'number': '1'},
+        ]})
+
+        writer = SnapshotWriter(self.snapshot_path, 'abc')
+        writer.add(staged_set)
+        writer.commit()
+
+        self.assertTrue(is_snapshot_valid(self.snapshot_path, 'abc'))
+        self.assertFalse(is_snapshot_valid(self.snapshot_path, 'def'))
+
+        loaded_sets = list(iter_snapshot(self.snapshot_path))
+        self.assertEqual(1, len(loaded_sets))
+        self.assertEqual(['One', 'Two'], [staged_card.get_name() for staged_card in loaded_sets[0].get_cards()])
+        self.assertEqual(1, loaded_sets[0].get_cards()[1].get_colour_weight())
+
+    def test_discard(self):
+        writer = SnapshotWriter(self.snapshot_path, 'abc')
+        writer.discard()
+
+        self.assertFalse(is_snapshot_valid(self.snapshot_path, 'abc'))
+        self.assertEqual([], os.listdir(self.temp_dir.name))
+
+
+def create_test_physical_card(card_names, set_obj: Set, rarity: Rarity, language: Language):
+    """
+    Creates a printing of each card in the set, with all of them sharing a single physical card
+    """
+    physical_card = PhysicalCard.objects.create(layout='split' if len(card_names) > 1 else 'normal')
+
+    for name in card_names:
+        printing = CardPrinting.objects.create(
+            card=create_test_card({'name': name}), set=set_obj, rarity=rarity, collector_number=0, is_starter=False)
+        printlang = CardPrintingLanguage.objects.create(card_printing=printing, language=language, card_name=name)
+        printlang.physical_cards.add(physical_card)
+
+    return physical_card
+
+
+class PhysicalCardMapTestCase(TestCase):
+    def test_split_card(self):
+        english = Language.objects.create(name='English')
+        rarity = create_test_rarity('Uncommon', 'U')
+        set_obj = create_test_set('Apocalypse', 'APC')
+        physical_card = create_test_physical_card(['Fire', 'Ice'], set_obj, rarity, english)
+
+        physical_card_map = get_physical_card_map({'Fire'})
+
+        self.assertEqual({('Fire', 'APC'): [physical_card.id]}, physical_card_map)
+
+
+class UserCardSyncTestCase(TestCase):
+    def setUp(self):
+        english = Language.objects.create(name='English')
+        rarity = create_test_rarity('Common', 'C')
+        set_obj = create_test_set('Apocalypse', 'APC')
+
+        self.forest = create_test_physical_card(['Forest'], set_obj, rarity, english)
+        self.island = create_test_physical_card(['Island'], set_obj, rarity, english)
+        self.plains = create_test_physical_card(['Plains'], set_obj, rarity, english)
+        self.fire_ice = create_test_physical_card(['Fire', 'Ice'], set_obj, rarity, english)
+
+        self.user = User.objects.create(username='tester')
+        self.other_user = User.objects.create(username='other')
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'cards.tsv')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_file(self, lines):
+        with open(self.file_path, 'w') as f:
+            f.writelines('\t'.join(line) + '\n' for line in lines)
+
+    def test_sync_owned_cards(self):
+        unchanged = UserOwnedCard.objects.create(physical_card=self.forest, count=2, owner=self.user)
+        updated = UserOwnedCard.objects.create(physical_card=self.island, count=1, owner=self.user)
+        UserOwnedCard.objects.create(physical_card=self.fire_ice, count=1, owner=self.user)
+        other_card = UserOwnedCard.objects.create(physical_card=self.fire_ice, count=5, owner=self.other_user)
+
+        self.write_file([('Forest', '2', 'APC'), ('Island', '3', 'APC'), ('Plains', '4', 'APC')])
+        call_command('import_usercards', 'tester', self.file_path, sync=True)
+
+        self.assertEqual({self.forest.id: 2, self.island.id: 3, self.plains.id: 4},
+                         dict(self.user.owned_cards.values_list('physical_card_id', 'count')))
+
+        # Rows that are still in the file are kept rather than recreated
+        self.assertTrue(UserOwnedCard.objects.filter(id=unchanged.id, count=2).exists())
+        self.assertTrue(UserOwnedCard.objects.filter(id=updated.id, count=3).exists())
+
+        # Other users' cards are left alone
+        self.assertTrue(UserOwnedCard.objects.filter(id=other_card.id, count=5).exists())
+
+    def test_sync_owned_cards_unchanged(self):
+        owned_card = UserOwnedCard.objects.create(physical_card=self.fire_ice, count=1, owner=self.user)
+
+        self.write_file([('Fire', '1', 'APC'), ('Ice', '1', 'APC')])
+        call_command('import_usercards', 'tester', self.file_path, sync=True)
+
+        self.assertEqual([owned_card.id], list(self.user.owned_cards.values_list('id', flat=True)))
+
+    def test_sync_card_changes(self):
+        date = utc.localize(datetime(2018, 1, 1, 12, 0, 0))
+        existing_ids = [UserCardChange.objects.create(physical_card=self.forest, date=date, difference=1,
+                                                      owner=self.user).id for _ in range(2)]
+        UserCardChange.objects.create(physical_card=self.island, date=date, difference=-1, owner=self.user)
+        other_change = UserCardChange.objects.create(physical_card=self.island, date=date, difference=-1,
+                                                     owner=self.other_user)
+
+        self.write_file([
+            ('Forest', 'APC', '2018-01-01 12:00:00', '1'),
+            ('Forest', 'APC', '2018-01-01 12:00:00', '1'),
+            ('Fire', 'APC', '2018-01-02 12:00:00', '2'),
+            ('Ice', 'APC', '2018-01-02 12:00:00', '2'),
+        ])
+        call_command('import_usercardchanges', 'tester', self.file_path, sync=True)
+
+        # The repeated line is only imported once, so only one of the repeated changes is kept
+        forest_change_ids = list(self.user.card_changes.filter(physical_card=self.forest).values_list('id', flat=True))
+        self.assertEqual(1, len(forest_change_ids))
+        self.assertIn(forest_change_ids[0], existing_ids)
+        self.assertEqual(1, self.user.card_changes.filter(physical_card=self.fire_ice, difference=2).count())
+        self.assertFalse(self.user.card_changes.filter(physical_card=self.island).exists())
+        self.assertTrue(UserCardChange.objects.filter(id=other_change.id).exists())
+
+    def test_sync_repeated_card_changes(self):
+        date = utc.localize(datetime(2018, 1, 1, 12, 0, 0))
+        existing = UserCardChange.objects.create(physical_card=self.forest, date=date, difference=1, owner=self.user)
+
+        self.write_file([('Forest', 'APC', '2018-01-01 12:00:00', '1')] * 3)
+        call_command('import_usercardchanges', 'tester', self.file_path, sync=True)
+
+        self.assertEqual([existing.id], list(
+            self.user.card_changes.filter(physical_card=self.forest).values_list('id', flat=True)))
+
+    def test_repeated_card_changes(self):
+        date = utc.localize(datetime(2018, 1, 1, 12, 0, 0))
+        UserCardChange.objects.create(physical_card=self.plains, date=date, difference=1, owner=self.user)
+
+        self.write_file([
+            ('Forest', 'APC', '2018-01-01 12:00:00', '1'),
+            ('Forest', 'APC', '2018-01-01 12:00:00', '1'),
+            ('Forest', 'APC', '2018-01-01 12:00:00', '2'),
+            ('Fire', 'APC', '2018-01-02 12:00:00', '1'),
+            ('Ice', 'APC', '2018-01-02 12:00:00', '1'),
+        ])
+        call_command('import_usercardchanges', 'tester', self.file_path)
+
+        # The user's changes are replaced, and each distinct change in the file is only added once
+        self.assertEqual(sorted([(self.forest.id, 1), (self.forest.id, 2), (self.fire_ice.id, 1)]),
+                         sorted(self.user.card_changes.values_list('physical_card_id', 'difference')))
+
+    def test_sync_card_changes_unchanged(self):
+        date = utc.localize(datetime(2018, 1, 1, 12, 0, 0))
+        change = UserCardChange.objects.create(physical_card=self.fire_ice, date=date, difference=1, owner=self.user)
+
+        self.write_file([('Fire', 'APC', '2018-01-01 12:00:00', '1'), ('Ice', 'APC', '2018-01-01 12:00:00', '1')])
+        call_command('import_usercardchanges', 'tester', self.file_path, sync=True)
+
+        self.assertEqual([change.id], list(self.user.card_changes.values_list('id', flat=True)))
+
+
+class DownloadRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves a single file that supports conditional and Range requests, and records the headers of each request
+    """
+    content = b'0123456789' * 100
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        content = self.content
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == self.etag:
+            start = int(range_header[len('bytes='):-1])
+            content = content[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(self.content) - 1}/{len(self.content)}')
+        else:
+            self.send_response(200)
+
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadFileTestCase(TestCase):
+    def setUp(self):
+        DownloadRequestHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), DownloadRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/AllSets-x.json.zip'
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, 'AllSets-x.json.zip')
+        self.metadata_path = self.file_path + '.meta.json'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def read_file(self):
+        with open(self.file_path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        self.assertTrue(download_file(self.url, self.file_path, self.metadata_path))
+        self.assertEqual(DownloadRequestHandler.content, self.read_file())
+        self.assertEqual('"v1"', load_metadata(self.metadata_path)['etag'])
+
+    def test_not_modified(self):
+        download_file(self.url, self.file_path, self.metadata_path)
+
+        self.assertFalse(download_file(self.url, self.file_path, self.metadata_path))
+        self.assertEqual('"v1"', DownloadRequestHandler.requests[-1]['If-None-Match'])
+        self.assertEqual(DownloadRequestHandler.content, self.read_file())
+
+    def test_force_unchanged_content(self):
+        download_file(self.url, self.file_path, self.metadata_path)
+
+        self.assertTrue(download_file(self.url, self.file_path, self.metadata_path, force=True))
+        self.assertNotIn('If-None-Match', DownloadRequestHandler.requests[-1])
+
+    def test_resume(self):
+        with open(self.file_path + '.part', 'wb') as f:
+            f.write(DownloadRequestHandler.content[:250])
+        with open(self.metadata_path, 'w') as f:
+            json.dump({'url': self.url, 'partial_etag': '"v1"'}, f)
+
+        self.assertTrue(download_file(self.url, self.file_path, self.metadata_path))
+        self.assertEqual('bytes=250-', DownloadRequestHandler.requests[-1]['Range'])
+        self.assertEqual(DownloadRequestHandler.content, self.read_file())
+        self.assertFalse(os.path.exists(self.file_path + '.part'))
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves an image for any path, failing the first request for paths that start with /flaky
+    """
+    content = b'\xff\xd8' + b'0' * 1000
+    requested_paths = []
+
+    def do_GET(self):
+        self.requested_paths.append(self.path)
+
+        if self.path.startswith('/flaky') and self.requested_paths.count(self.path) == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if self.path.startswith('/truncated') and self.requested_paths.count(self.path) == 1:
+            # Promises the whole image but closes the connection half way through it
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(self.content)))
+            self.end_headers()
+            self.wfile.write(self.content[:len(self.content) // 2])
+            self.close_connection = True
+            return
+
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.content)))
+        self.end_headers()
+        self.wfile.write(self.content)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageDownloaderTestCase(TestCase):
+    def setUp(self):
+        ImageRequestHandler.requested_paths = []
+        self.server = HTTPServer(('127.0.0.1', 0), ImageRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.downloader = ImageDownloader(concurrency=2, backoff=0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def test_download_all(self):
+        downloads = [(f'{self.base_url}/{i}', os.path.join(self.temp_dir.name, f'{i}.jpg')) for i in range(5)]
+
+        self.assertEqual((5, 0), self.downloader.download_all(downloads))
+        for _, image_path in downloads:
+            with open(image_path, 'rb') as f:
+                self.assertEqual(ImageRequestHandler.content, f.read())
+
+    def test_retry(self):
+        image_path = os.path.join(self.temp_dir.name, 'flaky.jpg')
+
+        self.assertTrue(self.downloader.download(f'{self.base_url}/flaky', image_path))
+        self.assertEqual(['/flaky', '/flaky'], ImageRequestHandler.requested_paths)
+
+    def test_retry_truncated(self):
+        image_path = os.path.join(self.temp_dir.name, 'truncated.jpg')
+
+        self.assertTrue(self.downloader.download(f'{self.base_url}/truncated', image_path))
+        with open(image_path, 'rb') as f:
+            self.assertEqual(ImageRequestHandler.content, f.read())
+
+    def test_download_all_unexpected_error(self):
+        downloads = [(f'{self.base_url}/1', os.path.join(self.temp_dir.name, 'missing_folder', '1.jpg')),
+                     (f'{self.base_url}/2', os.path.join(self.temp_dir.name, '2.jpg'))]
+
+        self.assertEqual((1, 1), self.downloader.download_all(downloads))
+
+    def test_not_found(self):
+        image_path = os.path.join(self.temp_dir.name, 'missing.jpg')
+
+        self.assertFalse(self.downloader.download(f'{self.base_url}/missing', image_path))
+        self.assertEqual(['/missing'], ImageRequestHandler.requested_paths)
+        self.assertEqual([], os.listdir(self.temp_dir.name))
+
+
+class TokenBucketTestCase(TestCase):
+    def test_acquire(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+
+        start_time = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+
+        # The first token is available straight away, and the next two take 1/20th of a second each
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.09)
+
+
+class BackupTestCase(TestCase):
+    def test_get_pg_dump_args(self):
+        database = {'NAME': 'sylvan', 'USER': 'sylvan_user', 'PASSWORD': 'secret', 'HOST': '', 'PORT': 5433}
+
+        self.assertEqual(['pg_dump', '--username', 'sylvan_user', '--dbname', 'sylvan', '--port', '5433'],
+                         get_pg_dump_args(database))
+
+    def test_throughput(self):
+        result = BackupResult('sylvan', 'sylvan.sql.gz', 4 * 1024 * 1024, 2.0)
+
+        self.assertEqual(2 * 1024 * 1024, result.get_throughput())
+        self.assertEqual(0.0, BackupResult('sylvan', 'sylvan.sql.gz', 0, 0).get_throughput())